@@ -4,7 +4,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_with_django_project.setti
 import django
 django.setup()
 
-from rango.models import Category, Page
+from rango.importer import import_rows
+from rango.models import Page
 
 def populate():
 
@@ -38,39 +39,23 @@ def populate():
 
     # if you want to add more catergories or pages, add them to the dictionaries above
 
-    # The code below goes through the cats dictionary, then adds each category,
-    # and then adds all the associated pages for that category
-    # if you are using Python 2.x then use cats.iteritems() see
-    # http://docs.quantifiedcode.com/python-anti-patterns/readability/not_using_items_to_iterate_over_a_dictionary.html
-    # for more information about using items() and how to iterate over a dictionary properly
-
+    # The code below flattens the cats dictionary into one row per page (or one
+    # row for a category without pages) and hands them to the bulk importer in
+    # rango/importer.py, which creates or updates everything in a few queries.
     # Using the .items returns the key and the value. In this case the key is "Python", "Django" or "Other Frameworks" and the value (cat_data) is the corresponding dictionary in cats.
+    rows = []
     for cat, cat_data in cats.items():
-        # c = add_cat(cat)
-        # Updated the population script to pass through the specific values for views and likes
-        c = add_cat(cat, cat_data["views"], cat_data["likes"])
+        category = {"category": cat, "category_views": cat_data["views"], "category_likes": cat_data["likes"]}
+        rows.append(category)
         for p in cat_data["pages"]:
-            add_page(c, p["title"], p["url"], p["views"])
+            row = dict(category)
+            row.update(p)
+            rows.append(row)
+    import_rows(rows)
 
     # Print out what we have added to the user.
-    for c in Category.objects.all():
-        for p in Page.objects.filter(category=c):
-            print("- {0} - {1}".format(str(c), str(p)))
-
-def add_page(cat, title, url, views=0):
-    p = Page.objects.get_or_create(category=cat, title=title)[0]
-    p.url=url
-    p.views=views
-    # we need to save the changes we made!!
-    p.save()
-    return p
-
-def add_cat(name, views=0, likes=0):
-    c = Category.objects.get_or_create(name=name)[0]
-    c.views=views
-    c.likes=likes
-    c.save()
-    return c
+    for p in Page.objects.select_related('category').order_by('category__name'):
+        print("- {0} - {1}".format(str(p.category), str(p)))
 
 # Start execution here!
 if __name__ == '__main__':
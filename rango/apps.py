@@ -1,5 +1,15 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        from rango import clicks, counters, hotness
+        import rango.signals  # noqa: connects the cache invalidation receivers
+        # Don't lose buffered views/likes when a worker shuts down cleanly.
+        atexit.register(counters.flush)
+        atexit.register(clicks.flush)
+        atexit.register(hotness.flush)
@@ -0,0 +1,53 @@
+"""
+The stock file-based cache, cheap enough to write on every click.
+
+Django's FileBasedCache lists the whole cache directory on every set() to
+see whether it is full, which costs milliseconds once it holds thousands
+of entries, and when it is full deletes a random third of them, throttle
+buckets and just-bumped versions included. This one looks at the directory
+at most once every CULL_INTERVAL seconds (an OPTIONS entry, default 10) per
+process, and culls the least recently written entries first, so the ones
+rango keeps rewriting (throttle buckets, leaderboards, versions) outlive
+old fragments.
+
+Like Django's, incr() is a get and a set, neither atomic nor keeping the
+entry's timeout; rango/caching.py does not use it.
+"""
+import os
+import threading
+import time
+
+from django.core.cache.backends import filebased
+
+# Per cache directory, shared by the per-thread cache instances
+_next_cull = {}
+_lock = threading.Lock()
+
+
+class FileBasedCache(filebased.FileBasedCache):
+
+    def __init__(self, dir, params):
+        super(FileBasedCache, self).__init__(dir, params)
+        options = params.get('OPTIONS') or {}
+        self._cull_interval = float(options.get('CULL_INTERVAL', 10))
+
+    def _cull(self):
+        now = time.time()
+        with _lock:
+            if now < _next_cull.get(self._dir, 0):
+                return
+            _next_cull[self._dir] = now + self._cull_interval
+        entries = [entry for entry in os.scandir(self._dir) if entry.name.endswith(self.cache_suffix)]
+        if len(entries) < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        written = []
+        for entry in entries:
+            try:
+                written.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+        written.sort()
+        for mtime, path in written[:len(written) // self._cull_frequency]:
+            self._delete(path)
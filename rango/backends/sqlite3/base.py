@@ -0,0 +1,87 @@
+"""
+The stock SQLite backend, with cursors that report the number and duration
+of queries to rango/metrics.py. Django 1.11 has no execute_wrapper(), so the
+cursor wrappers are swapped here instead.
+
+Connections also get the SQL functions rango needs and SQLite lacks, such
+as rango_logaddexp() for rango/hotness.py, and the PRAGMAS of their
+DATABASES entry, e.g.
+
+    'PRAGMAS': {'journal_mode': 'wal', 'busy_timeout': 5000}
+
+busy_timeout is applied first, so that switching the journal mode waits for
+other connections instead of failing.
+"""
+import math
+import time
+
+from django.db.backends import utils
+from django.db.backends.sqlite3 import base
+
+from rango import metrics
+
+
+class TimedCursorWrapper(utils.CursorWrapper):
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).execute(sql, params)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+
+class TimedCursorDebugWrapper(TimedCursorWrapper, utils.CursorDebugWrapper):
+    pass
+
+
+def logaddexp(a, b):
+    """log(exp(a) + exp(b)) without overflow; NULL counts as log(0)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _pragma_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    return "'{0}'".format(str(value).replace("'", "''"))
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        # Set on its connection by rango/write_queue.py, whose transactions
+        # always write: taking the write lock at BEGIN lets busy_timeout
+        # queue them, where upgrading a read lock later fails at once.
+        self.begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        conn.create_function('rango_logaddexp', 2, logaddexp)
+        pragmas = self.settings_dict.get('PRAGMAS') or {}
+        for name in sorted(pragmas, key=lambda name: name != 'busy_timeout'):
+            conn.execute('PRAGMA {0} = {1}'.format(name, _pragma_value(pragmas[name])))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
+
+    def make_cursor(self, cursor):
+        return TimedCursorWrapper(cursor, self)
+
+    def make_debug_cursor(self, cursor):
+        return TimedCursorDebugWrapper(cursor, self)
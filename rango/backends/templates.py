@@ -0,0 +1,26 @@
+"""
+The stock Django template backend, with renders timed for rango/metrics.py.
+"""
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+from rango import metrics
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        with metrics.template_timer():
+            return super(Template, self).render(context, request)
+
+
+class TimedDjangoTemplates(django_backend.DjangoTemplates):
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
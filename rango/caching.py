@@ -0,0 +1,122 @@
+"""
+Version-stamped fragment caching.
+
+Each cached fragment lives under a key that embeds the current version of
+the data it was rendered from, e.g. 'category' for the Category table or
+category_namespace(pk) for one category and its pages.
+Signal handlers in rango/signals.py bump the version whenever the data
+changes, so stale fragments are never read again and simply age out of the
+cache instead of having to be deleted one by one.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from rango import metrics
+
+VERSION_KEY = 'rango:version:{0}'
+MODIFIED_KEY = 'rango:modified:{0}'
+FRAGMENT_KEY = 'rango:fragment:{0}:v{1}:{2}'
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def category_namespace(category_id):
+    """Versions one category's own fragments, such as its page list."""
+    return 'category:{0}'.format(category_id)
+
+
+def _initial_version():
+    # Versions share the cache with the fragments and can be culled. Starting
+    # from the clock in microseconds rather than 1 means a re-created
+    # version is past any the fragments still cached were stored under.
+    return int(time.time() * 1000000)
+
+
+def get_version(namespace):
+    version = cache.get(VERSION_KEY.format(namespace))
+    if version is None:
+        # add() so two processes racing to initialise agree on the value
+        initial = _initial_version()
+        cache.add(VERSION_KEY.format(namespace), initial, None)
+        version = cache.get(VERSION_KEY.format(namespace), initial)
+    return version
+
+
+def bump_version(namespace):
+    key = VERSION_KEY.format(namespace)
+    cache.set(MODIFIED_KEY.format(namespace), time.time(), None)
+    # set() rather than incr(), which on the file cache is a get and a set
+    # that drops the timeout. Two racing bumps may both write, and either
+    # value is one no fragment was stored under, written after both
+    # changes committed, so losing the other is harmless.
+    version = max(_initial_version(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, None)
+    return version
+
+
+def last_modified(*namespaces):
+    """
+    Returns when any of the namespaces was last bumped, as an aware
+    datetime. A namespace with no recorded time counts as changed now.
+    """
+    latest = 0
+    for namespace in namespaces:
+        key = MODIFIED_KEY.format(namespace)
+        modified = cache.get(key)
+        if modified is None:
+            cache.add(key, time.time(), None)
+            modified = cache.get(key, time.time())
+        latest = max(latest, modified)
+    return datetime.fromtimestamp(latest, timezone.utc)
+
+
+class CacheStats(object):
+    """Per-process hit/miss counters for the fragment caches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, name, hit):
+        with self._lock:
+            self._counts[name]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def samples(self):
+        """The counts as rango_fragment_cache_lookups_total samples."""
+        return [((('fragment', name), ('result', result)), counts[key])
+                for name, counts in self.snapshot().items()
+                for result, key in (('hit', 'hits'), ('miss', 'misses'))]
+
+
+stats = CacheStats()
+metrics.register(metrics.Collected('rango_fragment_cache_lookups_total',
+                                   'Fragment cache lookups, by fragment and hit or miss.', 'counter',
+                                   stats.samples))
+
+
+def cached_fragment(name, namespace, variant, render):
+    """
+    Returns the fragment cached for (name, current version of namespace,
+    variant), calling render() to build and store it on a miss.
+    """
+    key = FRAGMENT_KEY.format(name, get_version(namespace), variant)
+    fragment = cache.get(key)
+    if fragment is not None:
+        stats.record(name, hit=True)
+        return fragment
+    stats.record(name, hit=False)
+    fragment = render()
+    cache.set(key, fragment, FRAGMENT_TIMEOUT)
+    return fragment
@@ -0,0 +1,81 @@
+"""
+Canonical form and fixed-width hash of page URLs, for duplicate detection.
+
+Two URLs that point at the same page should normalise to the same string:
+
+- a missing scheme means http, and http and https count as the same page;
+- scheme and host are lower-cased and default ports dropped;
+- the path's percent-encoding is normalised, an empty path becomes '/' and
+  a trailing slash is dropped;
+- tracking parameters (utm_*, fbclid, gclid, ...) are removed and the
+  remaining query parameters sorted;
+- the fragment is dropped.
+
+A URL whose host or port cannot be parsed (URLValidator lets ports like
+99999 through) has no canonical form and only matches itself.
+
+Page.url_hash stores url_hash(url), an indexed 40 character SHA-1 of the
+canonical form, so "does this category already have this page" is an index
+lookup whatever the length of the URLs.
+"""
+import hashlib
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMETERS = frozenset(['fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'yclid', '_ga'])
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+PATH_SAFE = "/:@!$&'()*+,;=~"
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMETERS or name.startswith(TRACKING_PREFIXES)
+
+
+def with_scheme(url):
+    """Adds http:// to a URL typed without a scheme."""
+    url = url.strip()
+    if url and '://' not in url:
+        url = 'http://' + url
+    return url
+
+
+def has_valid_port(url):
+    try:
+        urlsplit(with_scheme(url)).port
+    except ValueError:
+        return False
+    return True
+
+
+def normalize_url(url):
+    try:
+        parts = urlsplit(with_scheme(url))
+        host = (parts.hostname or '').rstrip('.')
+        port = parts.port
+    except ValueError:
+        # e.g. a port out of range or a broken IPv6 host: no canonical form,
+        # so it only matches itself
+        return url.strip()
+    scheme = parts.scheme.lower()
+    if ':' in host:
+        host = '[{0}]'.format(host)
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = '{0}:{1}'.format(host, port)
+    if parts.username:
+        netloc = '{0}@{1}'.format(parts.username, netloc)
+    if scheme == 'https':
+        scheme = 'http'
+
+    path = quote(unquote(parts.path), safe=PATH_SAFE) or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not _is_tracking(name))
+    return urlunsplit((scheme, netloc, path, urlencode(query), ''))
+
+
+def url_hash(url):
+    return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
@@ -0,0 +1,221 @@
+"""
+Click log, hourly/daily rollups and trending pages.
+
+track_url records every click here. Clicks are buffered in memory like the
+counters in rango/counters.py and appended to the ClickEvent table in
+batches, either every RANGO_CLICK_FLUSH_INTERVAL seconds or once
+RANGO_CLICK_FLUSH_THRESHOLD clicks are waiting.
+
+rollup() (the rollup_clicks command, run every few minutes) adds the
+logged clicks to per-page and per-category buckets of an hour and of a day
+and deletes them from the log, all in one transaction, so a click is
+counted exactly once. Hourly buckets older than
+RANGO_CLICK_HOURLY_RETENTION_DAYS are dropped; daily buckets are kept.
+
+trending_pages() and trending_categories() read the buckets only: hourly
+ones for windows within the hourly retention, daily ones beyond that. The
+window is rounded down to the bucket boundary, and clicks that have not
+been rolled up yet are not counted.
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from rango import write_queue
+from rango.models import Category, CategoryClicks, ClickEvent, Page, PageClicks
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 500
+
+
+class ClickBuffer(object):
+    """Collects (page_id, category_id, clicked_at) and bulk inserts them."""
+
+    def __init__(self, interval=5.0, threshold=500):
+        self.interval = interval
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def record(self, page_id, category_id, clicked_at=None):
+        with self._lock:
+            self._pending.append((page_id, category_id, clicked_at or timezone.now()))
+            flush_now = self.threshold and len(self._pending) >= self.threshold
+            if not flush_now and self._timer is None and self.interval:
+                self._timer = threading.Timer(self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Appends the buffered clicks to the log; returns how many."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            events = [ClickEvent(page_id=page_id, category_id=category_id, clicked_at=clicked_at)
+                      for page_id, category_id, clicked_at in pending]
+            # Serialised with the other buffered writes, see rango/write_queue.py
+            write_queue.run(lambda: ClickEvent.objects.bulk_create(events, batch_size=INSERT_BATCH_SIZE))
+        except Exception:
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+        return len(pending)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to write buffered clicks, will retry')
+        finally:
+            connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ClickBuffer(
+                    interval=getattr(settings, 'RANGO_CLICK_FLUSH_INTERVAL', 5.0),
+                    threshold=getattr(settings, 'RANGO_CLICK_FLUSH_THRESHOLD', 500))
+    return _buffer
+
+
+def record(page_id, category_id, clicked_at=None):
+    get_buffer().record(page_id, category_id, clicked_at)
+
+
+def flush():
+    return get_buffer().flush()
+
+
+def _hourly_retention():
+    return timedelta(days=getattr(settings, 'RANGO_CLICK_HOURLY_RETENTION_DAYS', 8))
+
+
+def _day_start(hour):
+    return timezone.localtime(hour).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _chunks(items, size=INSERT_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _add_clicks(model, subject, counts):
+    """Adds {(period, start, subject_id[, category_id]): clicks} to model's buckets."""
+    by_bucket = defaultdict(dict)
+    for key, clicks in counts.items():
+        by_bucket[key[:2]][key[2:]] = clicks
+    field = subject + '_id'
+    for (period, start), subjects in by_bucket.items():
+        buckets = model.objects.filter(period=period, start=start)
+        existing = set()
+        for chunk in _chunks(key[0] for key in subjects):
+            existing.update(buckets.filter(**{field + '__in': chunk}).values_list(field, flat=True))
+        # Like rango/counters.py: rows getting the same number of clicks share an UPDATE
+        increments = defaultdict(list)
+        new = []
+        for key, clicks in subjects.items():
+            if key[0] in existing:
+                increments[clicks].append(key[0])
+            elif subject == 'page':
+                new.append(model(period=period, start=start, page_id=key[0], category_id=key[1], clicks=clicks))
+            else:
+                new.append(model(period=period, start=start, category_id=key[0], clicks=clicks))
+        for clicks, ids in increments.items():
+            for chunk in _chunks(ids):
+                buckets.filter(**{field + '__in': chunk}).update(clicks=F('clicks') + clicks)
+        model.objects.bulk_create(new, batch_size=INSERT_BATCH_SIZE)
+
+
+def rollup():
+    """Compacts the click log into the hourly and daily buckets; returns the clicks rolled up."""
+    last_id = ClickEvent.objects.aggregate(last=Max('pk'))['last']
+    if last_id is None:
+        return 0
+    pages = defaultdict(int)
+    categories = defaultdict(int)
+    total = 0
+    with transaction.atomic():
+        hours = (ClickEvent.objects.filter(pk__lte=last_id)
+                 .annotate(hour=TruncHour('clicked_at'))
+                 .values_list('page_id', 'category_id', 'hour')
+                 .annotate(clicks=Count('pk')).order_by())
+        for page_id, category_id, hour, clicks in hours:
+            day = _day_start(hour)
+            pages[(PageClicks.HOUR, hour, page_id, category_id)] += clicks
+            pages[(PageClicks.DAY, day, page_id, category_id)] += clicks
+            categories[(PageClicks.HOUR, hour, category_id)] += clicks
+            categories[(PageClicks.DAY, day, category_id)] += clicks
+            total += clicks
+        _add_clicks(PageClicks, 'page', pages)
+        _add_clicks(CategoryClicks, 'category', categories)
+        ClickEvent.objects.filter(pk__lte=last_id).delete()
+
+        cutoff = timezone.now() - _hourly_retention()
+        PageClicks.objects.filter(period=PageClicks.HOUR, start__lt=cutoff).delete()
+        CategoryClicks.objects.filter(period=PageClicks.HOUR, start__lt=cutoff).delete()
+    return total
+
+
+def _window(hours):
+    now = timezone.now()
+    if timedelta(hours=hours) <= _hourly_retention():
+        return PageClicks.HOUR, (now - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    return PageClicks.DAY, _day_start(now - timedelta(hours=hours))
+
+
+def _trending(model, subject, hours, limit):
+    period, start = _window(hours)
+    return list(model.objects.filter(period=period, start__gte=start)
+                .values_list(subject + '_id').annotate(total=Sum('clicks'))
+                .order_by('-total', subject + '_id')[:limit])
+
+
+def trending_pages(hours=24, limit=10):
+    """
+    Returns up to limit pages, most clicked in the last hours first, each
+    with the click count set as recent_clicks.
+    """
+    rows = _trending(PageClicks, 'page', hours, limit)
+    found = Page.objects.in_bulk([pk for pk, total in rows])
+    return [_with_clicks(found[pk], total) for pk, total in rows if pk in found]
+
+
+def trending_categories(hours=24, limit=10):
+    rows = _trending(CategoryClicks, 'category', hours, limit)
+    found = Category.objects.in_bulk([pk for pk, total in rows])
+    return [_with_clicks(found[pk], total) for pk, total in rows if pk in found]
+
+
+def _with_clicks(obj, clicks):
+    obj.recent_clicks = clicks
+    return obj
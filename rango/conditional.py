@@ -0,0 +1,101 @@
+"""
+Conditional GET for the index and category pages.
+
+Their validators are computed from what the page is rendered from, without
+running the view: the cache version stamps of rango/caching.py, the index
+leaderboards (also held in the cache) and who is asking. A request whose
+If-None-Match (or, for anonymous users, If-Modified-Since) still matches
+gets a 304 before any of the view's queries or template rendering.
+
+Cache-Control is chosen per view and per auth state from
+RANGO_CACHE_CONTROL, e.g.
+
+    RANGO_CACHE_CONTROL = {
+        'show_category': {'anonymous': 'public, max-age=60',
+                          'authenticated': 'private, max-age=0, must-revalidate'},
+    }
+
+Views not listed there get DEFAULT_CACHE_CONTROL.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from rango import leaderboards, visits
+from rango.caching import category_namespace, get_version, last_modified
+from rango.models import Category
+
+DEFAULT_CACHE_CONTROL = {
+    'anonymous': 'private, max-age=0, must-revalidate',
+    'authenticated': 'private, max-age=0, must-revalidate',
+}
+
+
+def _auth_state(request):
+    user = request.user
+    if user.is_authenticated:
+        return 'user:{0}:{1}'.format(user.pk, user.username)
+    return 'anonymous'
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def index_etag(request):
+    # The visits cookie is part of it, so the once-a-day visit still gets counted
+    return _etag(_auth_state(request), get_version('category'), get_version('page'), get_version('hot'),
+                 leaderboards.categories.entries(), leaderboards.pages.entries(),
+                 request.COOKIES.get(visits.COOKIE), timezone.localdate().isoformat())
+
+
+def _category_id(request, slug):
+    # Both validators need it; look it up once per request
+    if getattr(request, '_rango_category_slug', None) != slug:
+        request._rango_category_slug = slug
+        request._rango_category_id = Category.objects.filter(slug=slug).values_list('pk', flat=True).first()
+    return request._rango_category_id
+
+
+def category_etag(request, category_name_slug):
+    category_id = _category_id(request, category_name_slug)
+    version = get_version(category_namespace(category_id)) if category_id else None
+    return _etag(_auth_state(request), category_name_slug, category_id, version, get_version('category'))
+
+
+def category_last_modified(request, category_name_slug):
+    # Only anonymous pages are the same for everyone who sends a date
+    if request.user.is_authenticated:
+        return None
+    category_id = _category_id(request, category_name_slug)
+    if category_id is None:
+        return None
+    return last_modified(category_namespace(category_id), 'category')
+
+
+def cache_control(view_name):
+    policies = getattr(settings, 'RANGO_CACHE_CONTROL', {})
+    return policies.get(view_name, DEFAULT_CACHE_CONTROL)
+
+
+def conditional_page(view_name, etag_func, last_modified_func=None):
+    """
+    Wraps a view with ETag/Last-Modified handling and the Cache-Control
+    policy configured for view_name.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            state = 'authenticated' if request.user.is_authenticated else 'anonymous'
+            response['Cache-Control'] = cache_control(view_name)[state]
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,205 @@
+"""
+Write-behind counters for Page.views, Category.likes and friends.
+
+Clicks and likes used to do a read-modify-write save() per request, which
+costs a full-row UPDATE, loses increments when two workers race and
+serialises every click on SQLite's write lock. Instead, increments are
+collected in memory and written back in batches as atomic F() updates,
+either every RANGO_COUNTER_FLUSH_INTERVAL seconds or as soon as
+RANGO_COUNTER_FLUSH_THRESHOLD increments are pending, whichever is first.
+Whatever is still buffered when the process exits cleanly is flushed by an
+atexit hook (see RangoConfig.ready).
+
+The flush_counters command asks every worker to flush through the cache.
+While a worker has anything buffered it looks for such a request every
+poll_interval seconds from a timer, so an idle worker answers it too.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from rango import write_queue
+
+logger = logging.getLogger(__name__)
+
+# Cache key bumped by the flush_counters command. Every process compares it
+# against the value it last saw and flushes its own buffer when it moves.
+# This only reaches other processes through a cache they share, such as the
+# file cache of settings.CACHES; with a per-process cache (LocMemCache) the
+# command can flush nothing but its own buffer.
+FLUSH_REQUEST_KEY = 'rango:counters:flush_request'
+
+# Keep each UPDATE ... WHERE id IN (...) below SQLite's bound-variable limit.
+UPDATE_CHUNK_SIZE = 500
+
+# Sent once per (model, field) after a flush has committed, with the primary
+# keys it updated; update() bypasses post_save, so caches listen for this.
+flushed = Signal(providing_args=['field', 'pks'])
+
+
+class CounterBuffer(object):
+    """
+    Collects (model, field, pk) -> delta increments and writes them back in
+    batches. Rows that received the same delta share a single UPDATE.
+    """
+
+    def __init__(self, interval=5.0, threshold=100, poll_interval=1.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._pending_count = 0
+        self._timer = None
+        self._poll_timer = None
+        self._flush_request_seen = None
+        self._polled = False
+        self._next_poll = 0
+
+    def incr(self, model, pk, field, amount=1):
+        with self._lock:
+            self._pending[(model, field, int(pk))] += amount
+            self._pending_count += 1
+            flush_now = self.threshold and self._pending_count >= self.threshold
+            if not flush_now:
+                self._schedule()
+        if flush_now or self._flush_requested():
+            self.flush()
+
+    def pending(self, model, pk, field):
+        """Returns the increment buffered for one row, not yet in the database."""
+        with self._lock:
+            return self._pending.get((model, field, int(pk)), 0)
+
+    def flush(self):
+        """
+        Writes every buffered increment in one transaction and returns how
+        many increments were written. On failure the increments are put back
+        so a later flush can retry them.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            pending_count, self._pending_count = self._pending_count, 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        groups = defaultdict(list)
+        for (model, field, pk), delta in pending.items():
+            groups[(model, field, delta)].append(pk)
+
+        try:
+            # Serialised with the other buffered writes, see rango/write_queue.py
+            write_queue.run(lambda: self._write(groups))
+        except Exception:
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending[key] += delta
+                self._pending_count += pending_count
+                self._schedule()
+            raise
+        updated = defaultdict(list)
+        for (model, field, delta), pks in groups.items():
+            updated[(model, field)].extend(pks)
+        for (model, field), pks in updated.items():
+            flushed.send(sender=model, field=field, pks=pks)
+        return pending_count
+
+    def _write(self, groups):
+        with transaction.atomic():
+            for (model, field, delta), pks in groups.items():
+                for start in range(0, len(pks), UPDATE_CHUNK_SIZE):
+                    chunk = pks[start:start + UPDATE_CHUNK_SIZE]
+                    model.objects.filter(pk__in=chunk).update(**{field: F(field) + delta})
+
+    def _schedule(self):
+        # Called with self._lock held.
+        if self._timer is None and self.interval:
+            self._timer = threading.Timer(self.interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+        if self._poll_timer is None and self.poll_interval:
+            self._poll_timer = threading.Timer(self.poll_interval, self._poll_from_timer)
+            self._poll_timer.daemon = True
+            self._poll_timer.start()
+
+    def _poll_from_timer(self):
+        with self._lock:
+            self._poll_timer = None
+        try:
+            if self._flush_requested():
+                self.flush()
+        except Exception:
+            logger.exception('Failed to flush buffered counters, will retry')
+        finally:
+            with self._lock:
+                # Polls for as long as there is something to flush
+                if self._pending:
+                    self._schedule()
+            connection.close()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush buffered counters, will retry')
+        finally:
+            # The timer thread got its own database connection; don't leak it.
+            connection.close()
+
+    def _flush_requested(self):
+        now = time.time()
+        if now < self._next_poll:
+            return False
+        self._next_poll = now + self.poll_interval
+        request = cache.get(FLUSH_REQUEST_KEY)
+        requested = self._polled and request != self._flush_request_seen
+        self._polled = True
+        self._flush_request_seen = request
+        return requested
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = CounterBuffer(
+                    interval=getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5.0),
+                    threshold=getattr(settings, 'RANGO_COUNTER_FLUSH_THRESHOLD', 100))
+    return _buffer
+
+
+def incr(model, pk, field, amount=1):
+    get_buffer().incr(model, pk, field, amount)
+
+
+def pending(model, pk, field):
+    return get_buffer().pending(model, pk, field)
+
+
+def flush():
+    return get_buffer().flush()
+
+
+def request_flush():
+    """
+    Asks every running process that shares the cache to flush its buffer on
+    its next increment.
+    """
+    cache.set(FLUSH_REQUEST_KEY, time.time(), None)
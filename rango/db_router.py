@@ -0,0 +1,120 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads go to one of the aliases
+in RANGO_DB_REPLICAS, picked at random per query, or to the primary when no
+replicas are configured. Each replica alias must also be in DATABASES and
+is never migrated: it is a copy of the primary kept up to date outside
+Django.
+
+Replicas lag, so a client that has just written reads from the primary for
+RANGO_DB_STICKY_SECONDS afterwards: the request that wrote sets a short
+lived PIN_COOKIE, and ReplicaPinningMiddleware pins every request carrying
+it to the primary. Within one request (or one thread outside requests)
+every read after the first write goes to the primary as well, and so does
+every read inside a transaction on the primary, where read-then-write code
+decides what to write from what it reads.
+
+A request (or thread) reads from one replica throughout, chosen on its
+first read, so that queries joined up in Python see the same lag.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = 'rango_primary'
+
+_local = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'RANGO_DB_REPLICAS', ())
+
+
+def sticky_seconds():
+    return getattr(settings, 'RANGO_DB_STICKY_SECONDS', 5)
+
+
+def is_pinned():
+    return getattr(_local, 'pinned', False)
+
+
+def pin():
+    """Sends this thread's reads to the primary until the next request starts."""
+    _local.pinned = True
+
+
+def mark_write():
+    """
+    Records that this thread wrote, so the rest of the request and the
+    client's next few requests read from the primary. The router calls it
+    for every write; views whose writes are buffered call it themselves.
+    """
+    _local.pinned = True
+    _local.wrote = True
+
+
+def reset(pinned=False):
+    """Forgets this thread's writes and replica, e.g. between requests."""
+    _local.wrote = False
+    _local.pinned = pinned
+    _local.replica = None
+
+
+def _replica(aliases):
+    replica = getattr(_local, 'replica', None)
+    if replica not in aliases:
+        replica = _local.replica = random.choice(aliases)
+    return replica
+
+
+class PrimaryReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or is_pinned() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return _replica(aliases)
+
+    def db_for_write(self, model, **hints):
+        mark_write()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        pool = set(replicas()) | {PRIMARY}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware(MiddlewareMixin):
+    """
+    Pins requests from clients that wrote in the last few seconds to the
+    primary. Goes before SessionMiddleware, so that session saves count as
+    writes too.
+    """
+
+    def process_request(self, request):
+        try:
+            reset(pinned=float(request.COOKIES[PIN_COOKIE]) > time.time())
+        except (KeyError, ValueError):
+            reset()
+
+    def process_response(self, request, response):
+        if getattr(_local, 'wrote', False) and replicas():
+            seconds = sticky_seconds()
+            response.set_cookie(PIN_COOKIE, '{0:.3f}'.format(time.time() + seconds),
+                                max_age=seconds, httponly=True)
+        reset()
+        return response
@@ -0,0 +1,104 @@
+"""
+Streaming export of the catalogue, in the row format rango/importer.py reads.
+
+Categories are walked in primary key order and merged with the pages walked
+in (category, primary key) order, so each category is followed by its pages
+without ever holding more than one iterator chunk of either table in memory.
+An incremental export only writes categories and pages whose primary key is
+above the given since_category_id / since_page_id; an old category still
+gets its rows when it has new pages, since every page row carries its
+category's columns.
+
+Incremental exports only carry new rows. The ids say nothing about rows
+changed since the last export (a renamed page, a new URL, more views or
+likes), so those are not exported again; take a full export to pick them
+up. Tracking them would take a modified timestamp that every counter flush
+and import update() also writes.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.db.models import Max
+
+from rango.importer import FIELDS
+from rango.models import Category, Page
+
+ROWS_PER_BLOCK = 500
+
+
+def high_water_marks():
+    """Returns the ids to pass as since_category_id/since_page_id next time."""
+    return (Category.objects.aggregate(last=Max('pk'))['last'] or 0,
+            Page.objects.aggregate(last=Max('pk'))['last'] or 0)
+
+
+def export_rows(since_category_id=0, since_page_id=0):
+    categories = (Category.objects.order_by('pk')
+                  .values_list('pk', 'name', 'views', 'likes').iterator())
+    pages = (Page.objects.filter(pk__gt=since_page_id).order_by('category_id', 'pk')
+             .values_list('category_id', 'title', 'url', 'views').iterator())
+    page = next(pages, None)
+    for pk, name, views, likes in categories:
+        category = {'category': name, 'category_views': views, 'category_likes': likes}
+        emitted = False
+        while page is not None and page[0] == pk:
+            row = dict(category)
+            row.update(title=page[1], url=page[2], views=page[3])
+            yield row
+            emitted = True
+            page = next(pages, None)
+        if not emitted and pk > since_category_id:
+            yield category
+
+
+def _jsonl_blocks(rows):
+    block = []
+    for row in rows:
+        block.append(json.dumps(row))
+        if len(block) >= ROWS_PER_BLOCK:
+            yield '\n'.join(block) + '\n'
+            block = []
+    if block:
+        yield '\n'.join(block) + '\n'
+
+
+def _csv_blocks(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= ROWS_PER_BLOCK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _gzip(blocks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_blocks(output_format='jsonl', compress=False, since_category_id=0, since_page_id=0):
+    """
+    Yields the export as a sequence of byte strings, ready for a
+    StreamingHttpResponse or a file.
+    """
+    rows = export_rows(since_category_id, since_page_id)
+    blocks = _csv_blocks(rows) if output_format == 'csv' else _jsonl_blocks(rows)
+    blocks = (block.encode('utf-8') for block in blocks)
+    if compress:
+        blocks = _gzip(blocks)
+    return blocks
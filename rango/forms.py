@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 
+from rango.canonical_urls import has_valid_port, url_hash, with_scheme
 from rango.models import Page, Category, UserProfile
 
 
@@ -20,15 +21,28 @@ class PageForm(forms.ModelForm):
     url = forms.URLField(max_length=200, help_text="Please enter the URL of the page")
     views = forms.IntegerField(widget=forms.HiddenInput(), initial=0)
 
+    def __init__(self, *args, **kwargs):
+        # The category the page is added to, if duplicates should be rejected
+        self.category = kwargs.pop('category', None)
+        super(PageForm, self).__init__(*args, **kwargs)
+
     def clean(self):
         cleaned_data = self.cleaned_data
         url = cleaned_data.get('url')
 
-        if url and not url.startswith('http://'):
-            url = 'http://' + url
+        # Only when there is no scheme at all, so https:// URLs survive
+        if url:
+            url = with_scheme(url)
             cleaned_data['url'] = url
-
-            return cleaned_data
+            # URLValidator accepts ports like 99999
+            if not has_valid_port(url):
+                self.add_error('url', 'Enter a valid URL.')
+                return cleaned_data
+            # Any variant of a URL the category has counts, see rango/canonical_urls.py
+            if self.category and Page.objects.filter(category=self.category, url_hash=url_hash(url)).exists():
+                self.add_error('url', 'This category already has that page.')
+
+        return cleaned_data
 
     class Meta:
         model = Page
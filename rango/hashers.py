@@ -0,0 +1,84 @@
+"""
+Password hashing on a bounded thread pool.
+
+PooledPBKDF2PasswordHasher is Django's PBKDF2 hasher (same algorithm name,
+so existing hashes verify unchanged) with every hash run on a per-process
+pool of RANGO_PASSWORD_HASH_WORKERS threads. However many requests want a
+hash at once, only that many hash in parallel, so the other views keep
+their share of the CPU. Up to RANGO_PASSWORD_HASH_QUEUE more requests wait
+for a thread; beyond that, PasswordHashingBusy is raised at once (answered
+with a 503 by the middleware in rango/throttle.py).
+
+The time spent waiting for a thread and hashing goes into the
+rango_password_hash_* histograms of rango/metrics.py.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+from rango import metrics
+
+
+class PasswordHashingBusy(Exception):
+    pass
+
+
+class HashingPool(object):
+
+    def __init__(self, workers=2, queue=8):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+
+    def run(self, label, func, *args):
+        """Runs func(*args) on the pool and returns its result."""
+        if not self._slots.acquire(False):
+            raise PasswordHashingBusy()
+        try:
+            queued = time.perf_counter()
+            return self._get_executor().submit(self._timed, label, queued, func, *args).result()
+        finally:
+            self._slots.release()
+
+    def _timed(self, label, queued, func, *args):
+        started = time.perf_counter()
+        metrics.password_hash_wait.observe(label, started - queued)
+        try:
+            return func(*args)
+        finally:
+            metrics.password_hash_duration.observe(label, time.perf_counter() - started)
+
+    def _get_executor(self):
+        # A forked worker does not inherit the parent's threads
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(workers=getattr(settings, 'RANGO_PASSWORD_HASH_WORKERS', 2),
+                                    queue=getattr(settings, 'RANGO_PASSWORD_HASH_QUEUE', 8))
+    return _pool
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+
+    def encode(self, password, salt, iterations=None):
+        return get_pool().run(self.algorithm, super(PooledPBKDF2PasswordHasher, self).encode,
+                              password, salt, iterations)
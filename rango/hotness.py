@@ -0,0 +1,157 @@
+"""
+Exponentially decayed "hot" score for categories.
+
+A like or click of weight w at time t is worth w * exp(-decay * (now - t))
+now, with decay = ln 2 / RANGO_HOT_HALF_LIFE_HOURS. Every score shrinks by
+the same factor as time passes, so the ranking only changes when events
+arrive, and the score can be kept relative to a fixed EPOCH instead:
+
+    Category.hot = log(sum of w * exp(decay * (t - EPOCH)))
+
+An event adds log(w) + decay * (t - EPOCH) with logaddexp, which is O(1)
+and cannot overflow however long the site runs, and nothing ever has to be
+rescanned or decayed in place. Ordering by hot is ordering by the decayed
+score, so "hot categories" is a read of the rango_category_hot_idx index;
+current_score() turns hot back into today's decayed value for display.
+
+Events are summed per category in memory (like rango/counters.py) and
+written back every RANGO_COUNTER_FLUSH_INTERVAL seconds, one UPDATE per
+category using the rango_logaddexp() SQL function that
+rango.backends.sqlite3 registers, so concurrent writers cannot lose each
+other's events.
+
+Stored hot values only compare under the decay they were written with.
+Changing RANGO_HOT_HALF_LIFE_HOURS leaves the old ones on a different scale
+from new events, so the ranking is wrong until they are reset with
+Category.objects.update(hot=None).
+"""
+import logging
+import math
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Func, Value
+from django.utils import timezone
+
+from rango import write_queue
+from rango.backends.sqlite3.base import logaddexp
+from rango.caching import bump_version
+from rango.models import Category
+
+logger = logging.getLogger(__name__)
+
+# Never change this: stored scores are relative to it.
+EPOCH = datetime(2017, 1, 1, tzinfo=timezone.utc)
+
+LIKE = 'like'
+CLICK = 'click'
+
+
+def decay_rate():
+    """Per second."""
+    return math.log(2) / (getattr(settings, 'RANGO_HOT_HALF_LIFE_HOURS', 72) * 3600.0)
+
+
+def event_weight(kind):
+    return getattr(settings, 'RANGO_HOT_WEIGHTS', {LIKE: 1.0, CLICK: 0.2})[kind]
+
+
+def log_weight(weight, when):
+    return math.log(weight) + decay_rate() * (when - EPOCH).total_seconds()
+
+
+def current_score(hot, now=None):
+    """The decayed weight a stored hot value stands for at now."""
+    if hot is None:
+        return 0.0
+    now = now or timezone.now()
+    return math.exp(hot - decay_rate() * (now - EPOCH).total_seconds())
+
+
+class LogAddExp(Func):
+    function = 'rango_logaddexp'
+
+
+class HotScoreBuffer(object):
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def record(self, category_id, kind, when=None):
+        term = log_weight(event_weight(kind), when or timezone.now())
+        with self._lock:
+            self._pending[category_id] = logaddexp(self._pending.get(category_id), term)
+            if self._timer is None and self.interval:
+                self._timer = threading.Timer(self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if not self.interval:
+            self.flush()
+
+    def pending(self, category_id):
+        with self._lock:
+            return self._pending.get(category_id)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            # Serialised with the other buffered writes, see rango/write_queue.py
+            write_queue.run(lambda: self._write(pending))
+        except Exception:
+            with self._lock:
+                for category_id, term in pending.items():
+                    self._pending[category_id] = logaddexp(self._pending.get(category_id), term)
+            raise
+        bump_version('hot')
+        return len(pending)
+
+    def _write(self, pending):
+        with transaction.atomic():
+            for category_id, term in pending.items():
+                Category.objects.filter(pk=category_id).update(hot=LogAddExp(F('hot'), Value(term)))
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to write hot scores, will retry')
+        finally:
+            connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = HotScoreBuffer(interval=getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 5.0))
+    return _buffer
+
+
+def record(category_id, kind, when=None):
+    get_buffer().record(category_id, kind, when)
+
+
+def flush():
+    return get_buffer().flush()
+
+
+def hot_categories(limit=5):
+    return Category.objects.filter(hot__isnull=False).order_by('-hot')[:limit]
@@ -0,0 +1,207 @@
+"""
+Streaming bulk importer for categories and pages.
+
+Input is JSONL or CSV, one row per page, with the columns
+
+    category, category_views, category_likes, title, url, views
+
+A row without a title only creates or updates its category. Rows are read
+lazily and handled in chunks: each chunk resolves its categories by slug in
+one query, inserts what is new with bulk_create, updates what changed, and
+commits as one transaction. Memory use is bounded by the chunk size, not by
+the size of the input. Existing pages are matched on their category and
+canonical URL (see rango/canonical_urls.py), so re-importing a URL with a
+different scheme, trailing slash or tracking parameters updates the page
+instead of adding a duplicate; rows without a URL are matched on title.
+"""
+import csv
+import json
+import time
+
+from django.db import transaction
+from django.template.defaultfilters import slugify
+
+from rango import leaderboards, local_search
+from rango.caching import bump_version, category_namespace
+from rango.canonical_urls import url_hash
+from rango.models import Category, Page
+
+FIELDS = ('category', 'category_views', 'category_likes', 'title', 'url', 'views')
+CHUNK_SIZE = 500
+
+# Page fields a row is matched on, with or without a URL
+URL_HASH, TITLE = 'url_hash', 'title'
+
+
+def read_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    for row in csv.DictReader(lines):
+        yield row
+
+
+class ImportStats(object):
+
+    def __init__(self):
+        self.rows = 0
+        self.categories_created = 0
+        self.categories_updated = 0
+        self.pages_created = 0
+        self.pages_updated = 0
+        self.started = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return ('{0} rows ({1:.0f} rows/s): {2} categories created, {3} updated; '
+                '{4} pages created, {5} updated').format(
+            self.rows, self.rows_per_second, self.categories_created, self.categories_updated,
+            self.pages_created, self.pages_updated)
+
+
+def _int_or_none(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_rows(rows, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Imports an iterable of row dictionaries and returns an ImportStats.
+    progress, if given, is called with the stats after every chunk.
+    """
+    stats = ImportStats()
+    for chunk in _chunks(rows, chunk_size):
+        stale = set()
+        with transaction.atomic():
+            _import_chunk(chunk, stats, stale)
+        # Only once the chunk is committed, or a page list rendered in
+        # between would be cached under the new version
+        for namespace in stale:
+            bump_version(namespace)
+        stats.rows += len(chunk)
+        if progress:
+            progress(stats)
+    if stats.categories_created or stats.categories_updated or stats.pages_created or stats.pages_updated:
+        # bulk_create() and update() bypass the model signals
+        bump_version('category')
+        leaderboards.rebuild_all()
+    return stats
+
+
+def _categories_by_slug(slugs):
+    return dict((category.slug, category) for category in Category.objects.filter(slug__in=list(slugs)))
+
+
+def _import_chunk(chunk, stats, stale):
+    # Adds the cache namespaces the chunk changes to stale, see rango/caching.py
+    # Categories: the last row mentioning a category wins.
+    categories = {}
+    for row in chunk:
+        name = row['category'].strip()
+        slug = slugify(name)
+        wanted = categories.setdefault(slug, {'name': name})
+        for field, column in (('views', 'category_views'), ('likes', 'category_likes')):
+            value = _int_or_none(row.get(column))
+            if value is not None:
+                wanted[field] = value
+
+    existing = _categories_by_slug(categories)
+    new = [Category(name=wanted['name'], slug=slug, views=wanted.get('views', 0), likes=wanted.get('likes', 0))
+           for slug, wanted in categories.items() if slug not in existing]
+    if new:
+        Category.objects.bulk_create(new)
+        stats.categories_created += len(new)
+    for slug, category in existing.items():
+        changes = dict((field, value) for field, value in categories[slug].items()
+                       if field != 'name' and getattr(category, field) != value)
+        if changes:
+            Category.objects.filter(pk=category.pk).update(**changes)
+            stats.categories_updated += 1
+            stale.add(category_namespace(category.pk))
+    if new:
+        created = _categories_by_slug([category.slug for category in new])
+        existing.update(created)
+        local_search.index_categories((category.pk, category.name) for category in created.values())
+
+    # Pages, keyed on (category, canonical URL hash), or on (category, title)
+    # for rows without a URL; again the last row wins.
+    pages = {}
+    for row in chunk:
+        title = (row.get('title') or '').strip()
+        if not title:
+            continue
+        category_id = existing[slugify(row['category'].strip())].pk
+        url = (row.get('url') or '').strip()
+        key = (category_id, URL_HASH, url_hash(url)) if url else (category_id, TITLE, title)
+        wanted = pages.setdefault(key, {})
+        wanted['title'] = title
+        if url:
+            wanted['url'] = url
+        views = _int_or_none(row.get('views'))
+        if views is not None:
+            wanted['views'] = views
+    if not pages:
+        return
+
+    category_ids = set(key[0] for key in pages)
+    found = {}
+    for field in (URL_HASH, TITLE):
+        values = set(key[2] for key in pages if key[1] == field)
+        if values:
+            for pk, category_id, value, title, url, views in (
+                    Page.objects.filter(category_id__in=category_ids, **{field + '__in': values})
+                    .values_list('pk', 'category_id', field, 'title', 'url', 'views')):
+                found[(category_id, field, value)] = (pk, title, url, views)
+    new = []
+    touched = []
+    for key, wanted in pages.items():
+        if key not in found:
+            url = wanted.get('url', '')
+            new.append(Page(category_id=key[0], title=wanted['title'], url=url, url_hash=url_hash(url),
+                            views=wanted.get('views', 0)))
+            continue
+        pk, title, url, views = found[key]
+        current = {'title': title, 'url': url, 'views': views}
+        changes = dict((field, value) for field, value in wanted.items() if value != current[field])
+        if changes:
+            if 'url' in changes:
+                changes['url_hash'] = url_hash(changes['url'])
+            Page.objects.filter(pk=pk).update(**changes)
+            stats.pages_updated += 1
+            touched.append(pk)
+    if new:
+        Page.objects.bulk_create(new)
+        stats.pages_created += len(new)
+        new_keys = set((page.category_id, page.url_hash, page.title) for page in new)
+        touched.extend(pk for pk, category_id, hashed, title in
+                       Page.objects.filter(category_id__in=category_ids,
+                                           url_hash__in=set(page.url_hash for page in new))
+                       .values_list('pk', 'category_id', 'url_hash', 'title')
+                       if (category_id, hashed, title) in new_keys)
+    if touched:
+        # Their categories' cached page lists are stale now
+        stale.update(category_namespace(category_id) for category_id in category_ids)
+        local_search.index_pages(Page.objects.filter(pk__in=touched).values_list('pk', 'title', 'url'))
@@ -0,0 +1,140 @@
+"""
+Incrementally maintained top-N leaderboards for the index page.
+
+Each board is a short list of (score, pk) pairs kept in the cache in rank
+order. The increment paths (track_url, like_category) and the model signals
+offer new scores to it, so the index view only has to fetch a handful of
+rows by primary key instead of sorting the whole table. A board that can no
+longer be trusted (a member dropped or lost score while the board was full)
+is thrown away and rebuilt from the database on the next read; the
+rebuild_leaderboards command does the same on demand.
+
+Updates are serialised per process only. Two processes updating the same
+board at the same instant can lose one of the updates; the next increment
+of that row puts it right. Increments flushed by a process whose offers
+never reached the board are picked up by rebuilding every board from the
+database RANGO_LEADERBOARD_TTL seconds after it was built, whatever updates
+it has had since.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rango.models import Category, Page
+
+
+class Leaderboard(object):
+
+    def __init__(self, model, field, size=None):
+        self.model = model
+        self.field = field
+        self.size = size or getattr(settings, 'RANGO_LEADERBOARD_SIZE', 5)
+        self.key = 'rango:leaderboard:{0}:{1}'.format(model._meta.label_lower, field)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Returns (board, rebuild time), or (None, None) once it is due for a rebuild."""
+        stored = cache.get(self.key)
+        if stored is None or stored[0] <= time.time():
+            return None, None
+        return stored[1], stored[0]
+
+    def _store(self, board, rebuild_at=None):
+        now = time.time()
+        if rebuild_at is None:
+            rebuild_at = now + getattr(settings, 'RANGO_LEADERBOARD_TTL', 60)
+        cache.set(self.key, (rebuild_at, board), max(1, int(rebuild_at - now) + 1))
+
+    def entries(self):
+        """Returns the board as a list of (score, pk), best first."""
+        board, rebuild_at = self._load()
+        if board is None:
+            board = self.rebuild()
+        return board
+
+    def top_queryset(self):
+        return (self.model.objects.order_by('-' + self.field, 'id')
+                .values_list('id', self.field)[:self.size])
+
+    def rebuild(self):
+        board = [(score, pk) for pk, score in self.top_queryset()]
+        self._store(board)
+        return board
+
+    def invalidate(self):
+        cache.delete(self.key)
+
+    def offer(self, pk, score):
+        """Records the exact current score of a row, e.g. after a save()."""
+        self._update(pk, score, increment=False)
+
+    def record_increment(self, pk, score):
+        """
+        Records a score that only ever grows. A lower score than the one on
+        the board just means the caller read the row before a flush landed.
+        """
+        self._update(pk, score, increment=True)
+
+    def remove(self, pk):
+        with self._lock:
+            board, rebuild_at = self._load()
+            if board is None:
+                return
+            entries = [entry for entry in board if entry[1] != pk]
+            if len(entries) == len(board):
+                return
+            if len(board) >= self.size:
+                # Some row outside the board should move up; only the
+                # database knows which.
+                self.invalidate()
+            else:
+                self._store(entries, rebuild_at)
+
+    def objects(self):
+        """
+        Returns the ranked model instances, with the board's score (which
+        includes increments not flushed yet) set on each one.
+        """
+        board = self.entries()
+        rows = self.model.objects.in_bulk([pk for score, pk in board])
+        ranked = []
+        for score, pk in board:
+            obj = rows.get(pk)
+            if obj is not None:
+                setattr(obj, self.field, max(score, getattr(obj, self.field)))
+                ranked.append(obj)
+        return ranked
+
+    def _update(self, pk, score, increment):
+        with self._lock:
+            board, rebuild_at = self._load()
+            if board is None:
+                # Rebuilt from the database on the next read.
+                return
+            old = dict((member_pk, member_score) for member_score, member_pk in board)
+            if pk in old and increment:
+                score = max(score, old[pk])
+            full = len(board) >= self.size
+            below_floor = full and (-score, pk) > (-board[-1][0], board[-1][1])
+
+            if pk not in old and below_floor:
+                return
+            if pk in old and below_floor and score < old[pk]:
+                # Rows outside the board may now outrank this one.
+                self.invalidate()
+                return
+
+            old[pk] = score
+            entries = sorted(((s, p) for p, s in old.items()), key=lambda entry: (-entry[0], entry[1]))
+            self._store(entries[:self.size], rebuild_at)
+
+
+categories = Leaderboard(Category, 'likes')
+pages = Leaderboard(Page, 'views')
+
+
+def rebuild_all():
+    categories.rebuild()
+    pages.rebuild()
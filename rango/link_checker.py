@@ -0,0 +1,198 @@
+"""
+Concurrent link-health checks of Page URLs.
+
+Every URL is requested with HEAD, falling back to GET when the server
+refuses HEAD or answers it with garbage, following up to MAX_REDIRECTS redirects. The
+outcome (final status or error, latency, final URL) is written to the
+page's LinkCheck row.
+
+The checks run on one asyncio event loop with a small HTTP/1.1 client that
+reads no further than the response headers. At most `concurrency` requests
+are in flight overall and at most `per_host` to any one host; each attempt
+is cut off after `timeout` seconds. Pages are read in primary key order in
+chunks and results written back in batches, so memory use does not depend
+on the number of pages.
+"""
+import asyncio
+import ssl
+import time
+from collections import namedtuple
+from urllib.parse import quote, urljoin, urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from rango.models import LinkCheck, Page
+
+USER_AGENT = 'rango-link-checker/1.0'
+MAX_REDIRECTS = 5
+MAX_HEADERS = 100
+REDIRECT_STATUSES = frozenset([301, 302, 303, 307, 308])
+# Answers that often mean "not with HEAD" rather than "not there"
+HEAD_FALLBACK_STATUSES = frozenset([400, 403, 404, 405, 501])
+PAGE_CHUNK_SIZE = 1000
+WRITE_BATCH_SIZE = 500
+
+Result = namedtuple('Result', ['status', 'final_url', 'latency', 'error'])
+
+
+class LinkCheckError(Exception):
+    pass
+
+
+_ssl_context = None
+
+
+def _get_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+async def request_headers(method, url):
+    """Sends one request and returns (status, Location header or None)."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise LinkCheckError('not an http(s) URL')
+    secure = parts.scheme == 'https'
+    host = parts.hostname.encode('idna').decode('ascii')
+    reader, writer = await asyncio.open_connection(
+        host, parts.port or (443 if secure else 80), ssl=_get_ssl_context() if secure else None)
+    try:
+        target = quote(parts.path or '/', safe="/%:@!$&'()*+,;=~")
+        if parts.query:
+            target += '?' + quote(parts.query, safe="/%:@!$&'()*+,;=~?")
+        if parts.port:
+            host = '{0}:{1}'.format(host, parts.port)
+        writer.write('{0} {1} HTTP/1.1\r\nHost: {2}\r\nUser-Agent: {3}\r\nAccept: */*\r\n'
+                     'Connection: close\r\n\r\n'.format(method, target, host, USER_AGENT).encode('ascii'))
+        status_line = (await reader.readline()).decode('latin-1').split(None, 2)
+        if len(status_line) < 2 or not status_line[0].startswith('HTTP/') or not status_line[1].isdigit():
+            raise LinkCheckError('malformed status line')
+        location = None
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'location':
+                location = value.strip()
+        return int(status_line[1]), location
+    finally:
+        writer.close()
+
+
+async def follow(method, url, timeout):
+    """Returns (status, final URL), following redirects."""
+    for _ in range(MAX_REDIRECTS + 1):
+        status, location = await asyncio.wait_for(request_headers(method, url), timeout)
+        if status not in REDIRECT_STATUSES or not location:
+            return status, url
+        url = urljoin(url, location)
+    raise LinkCheckError('too many redirects')
+
+
+async def check_url(url, timeout):
+    started = time.perf_counter()
+    try:
+        try:
+            status, final_url = await follow('HEAD', url, timeout)
+        except LinkCheckError:
+            # Some servers close the connection or answer garbage to HEAD
+            status = None
+        if status is None or status in HEAD_FALLBACK_STATUSES:
+            status, final_url = await follow('GET', url, timeout)
+    except asyncio.TimeoutError:
+        return Result(None, '', time.perf_counter() - started, 'timed out')
+    except (LinkCheckError, OSError, ValueError) as e:
+        return Result(None, '', time.perf_counter() - started, str(e) or type(e).__name__)
+    return Result(status, final_url, time.perf_counter() - started, '')
+
+
+class LinkChecker(object):
+
+    def __init__(self, concurrency=None, per_host=None, timeout=None):
+        self.concurrency = concurrency or getattr(settings, 'RANGO_LINK_CHECK_CONCURRENCY', 100)
+        self.per_host = per_host or getattr(settings, 'RANGO_LINK_CHECK_PER_HOST', 2)
+        self.timeout = timeout or getattr(settings, 'RANGO_LINK_CHECK_TIMEOUT', 10)
+        self.checked = 0
+        self.healthy = 0
+        self._hosts = {}
+
+    def run(self, pages):
+        """Checks (pk, url) pairs and stores the results; returns how many were checked."""
+        # Not asyncio.run(): that needs Python 3.7
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._check_all(pages))
+        finally:
+            loop.close()
+        return self.checked
+
+    async def _check_all(self, pages):
+        overall = asyncio.Semaphore(self.concurrency)
+        # Bounds the tasks waiting on a busy host as well as those running
+        scheduled = asyncio.Semaphore(self.concurrency * 4)
+        # host -> [semaphore, tasks using it]; a host's entry goes once its
+        # last scheduled task is done, so this holds at most the hosts of
+        # the scheduled tasks however many hosts the run visits.
+        hosts = self._hosts = {}
+        results = []
+        tasks = set()
+
+        async def check(pk, url):
+            host = urlsplit(url).hostname or ''
+            entry = hosts.setdefault(host, [asyncio.Semaphore(self.per_host), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    async with overall:
+                        results.append((pk, await check_url(url, self.timeout)))
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del hosts[host]
+                scheduled.release()
+
+        for pk, url in pages:
+            await scheduled.acquire()
+            task = asyncio.ensure_future(check(pk, url))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if len(results) >= WRITE_BATCH_SIZE:
+                self._store(results)
+                results = []
+                # The tasks still running append to the new list
+        if tasks:
+            await asyncio.wait(tasks)
+        self._store(results)
+
+    def _store(self, results):
+        if not results:
+            return
+        now = timezone.now()
+        rows = [LinkCheck(page_id=pk, status=result.status, error=result.error[:200],
+                          latency=result.latency, final_url=result.final_url[:2000], checked_at=now)
+                for pk, result in results]
+        with transaction.atomic():
+            LinkCheck.objects.filter(page_id__in=[pk for pk, result in results]).delete()
+            LinkCheck.objects.bulk_create(rows)
+        self.checked += len(rows)
+        self.healthy += sum(1 for row in rows if row.is_healthy)
+
+
+def pages_to_check(checked_before=None):
+    """Yields (pk, url) for every page, or those not checked since checked_before."""
+    pages = Page.objects.order_by('pk')
+    if checked_before is not None:
+        pages = pages.exclude(link_check__checked_at__gte=checked_before)
+    last_pk = 0
+    while True:
+        chunk = list(pages.filter(pk__gt=last_pk).values_list('pk', 'url')[:PAGE_CHUNK_SIZE])
+        if not chunk:
+            return
+        for row in chunk:
+            yield row
+        last_pk = chunk[-1][0]
@@ -0,0 +1,165 @@
+"""
+Local full-text search over Category names and Page titles/URLs.
+
+Backed by an SQLite FTS5 table (created by migration 0006) that the save and
+delete signals in rango/signals.py keep in sync. Categories and pages share
+the table; the FTS rowid encodes which one a row is (pk * 2 for a category,
+pk * 2 + 1 for a page), so updates and deletes are rowid lookups rather than
+scans. Results are ranked with BM25, titles weighing more than URLs.
+
+On other database backends the index is simply not there: the functions
+below do nothing and search() returns no results.
+"""
+import re
+
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+
+from rango.models import Category, Page
+
+TABLE = 'rango_search_index'
+TITLE_WEIGHT = 10.0
+URL_WEIGHT = 1.0
+REBUILD_CHUNK_SIZE = 2000
+
+CATEGORY, PAGE = 0, 1
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(kind, pk):
+    return pk * 2 + kind
+
+
+def _write(kind, pk, title, url):
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0} WHERE rowid = %s'.format(TABLE), [_rowid(kind, pk)])
+        cursor.execute('INSERT INTO {0} (rowid, title, url) VALUES (%s, %s, %s)'.format(TABLE),
+                       [_rowid(kind, pk), title, url])
+
+
+def _delete(kind, pk):
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0} WHERE rowid = %s'.format(TABLE), [_rowid(kind, pk)])
+
+
+def index_category(category):
+    if is_available():
+        _write(CATEGORY, category.pk, category.name, '')
+
+
+def index_page(page):
+    if is_available():
+        _write(PAGE, page.pk, page.title, page.url)
+
+
+def _write_many(kind, rows):
+    rows = [(_rowid(kind, row[0]),) + tuple(row[1:]) for row in rows]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM {0} WHERE rowid = %s'.format(TABLE), [row[:1] for row in rows])
+            cursor.executemany('INSERT INTO {0} (rowid, title, url) VALUES (%s, %s, %s)'.format(TABLE), rows)
+
+
+def index_categories(rows):
+    """Indexes (pk, name) pairs in bulk, for writers that bypass the signals."""
+    if is_available():
+        _write_many(CATEGORY, ((pk, name, '') for pk, name in rows))
+
+
+def index_pages(rows):
+    """Indexes (pk, title, url) triples in bulk, for writers that bypass the signals."""
+    if is_available():
+        _write_many(PAGE, rows)
+
+
+def remove_category(pk):
+    if is_available():
+        _delete(CATEGORY, pk)
+
+
+def remove_page(pk):
+    if is_available():
+        _delete(PAGE, pk)
+
+
+def rebuild():
+    """Re-indexes every category and page; returns how many rows were indexed."""
+    if not is_available():
+        return 0
+    count = 0
+    insert = 'INSERT INTO {0} (rowid, title, url) VALUES (%s, %s, %s)'.format(TABLE)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0}'.format(TABLE))
+        rows = ((_rowid(CATEGORY, pk), name, '')
+                for pk, name in Category.objects.values_list('pk', 'name').iterator())
+        count += _insert_chunked(cursor, insert, rows)
+        rows = ((_rowid(PAGE, pk), title, url)
+                for pk, title, url in Page.objects.values_list('pk', 'title', 'url').iterator())
+        count += _insert_chunked(cursor, insert, rows)
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(TABLE))
+    return count
+
+
+def _insert_chunked(cursor, sql, rows):
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= REBUILD_CHUNK_SIZE:
+            cursor.executemany(sql, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(sql, chunk)
+        count += len(chunk)
+    return count
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, the last one
+    as a prefix so results show up while the user is still typing.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    terms = ['"{0}"'.format(word) for word in words]
+    terms[-1] += '*'
+    return ' AND '.join(terms)
+
+
+def search(query, limit=10):
+    """
+    Returns up to limit matches, best first, in the same shape as the
+    Webhose results: dictionaries with a title, link and summary.
+    """
+    expression = match_expression(query)
+    if not expression or not is_available():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM {0} WHERE {0} MATCH %s ORDER BY bm25({0}, %s, %s) LIMIT %s'.format(TABLE),
+            [expression, TITLE_WEIGHT, URL_WEIGHT, limit])
+        rowids = [row[0] for row in cursor.fetchall()]
+
+    categories = Category.objects.in_bulk([rowid // 2 for rowid in rowids if rowid % 2 == CATEGORY])
+    pages = Page.objects.select_related('category').in_bulk(
+        [rowid // 2 for rowid in rowids if rowid % 2 == PAGE])
+    results = []
+    for rowid in rowids:
+        if rowid % 2 == CATEGORY:
+            category = categories.get(rowid // 2)
+            if category is not None:
+                results.append({'title': category.name,
+                                'link': reverse('show_category', args=[category.slug]),
+                                'summary': 'Category'})
+        else:
+            page = pages.get(rowid // 2)
+            if page is not None:
+                results.append({'title': page.title,
+                                'link': page.url,
+                                'summary': 'Page in {0}'.format(page.category.name)})
+    return results
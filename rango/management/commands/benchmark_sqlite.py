@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+from django.test import override_settings
+
+from rango.models import Category, Page
+from rango.write_queue import WriteQueue
+
+ALIAS = 'rango_benchmark'
+ROWS_PER_WRITE = 10
+
+
+class ScratchRouter(object):
+
+    def db_for_read(self, model, **hints):
+        return ALIAS
+
+    def db_for_write(self, model, **hints):
+        return ALIAS
+
+
+class Command(BaseCommand):
+    help = ('Measures reader latency and write throughput on a scratch SQLite database, with '
+            "SQLite's defaults and one connection per writer (before), then with the PRAGMAS of "
+            'the default database and the single-writer queue (after).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Reader processes.')
+        parser.add_argument('--writers', type=int, default=4, help='Writer processes.')
+        parser.add_argument('--seconds', type=float, default=5, help='How long each run lasts.')
+        parser.add_argument('--pages', type=int, default=20000, help='Pages in the scratch database.')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            before = self.measure(directory, 'before', {}, False, options)
+            after = self.measure(directory, 'after', settings.DATABASES[DEFAULT_DB_ALIAS].get('PRAGMAS', {}),
+                                 True, options)
+        finally:
+            shutil.rmtree(directory)
+        for name, result in (('before', before), ('after', after)):
+            self.stdout.write(
+                '{0:>6}: reads p50 {1:.1f} ms, p99 {2:.1f} ms; {3:.0f} writes/s; '
+                '{4} reads and {5} writes failed'.format(name, *result))
+
+    def measure(self, directory, name, pragmas, use_queue, options):
+        connections.databases[ALIAS] = {'ENGINE': 'rango.backends.sqlite3',
+                                        'NAME': os.path.join(directory, name + '.sqlite3'),
+                                        'PRAGMAS': pragmas}
+        try:
+            # Data migrations that do not pass using= would otherwise touch
+            # the real database, see migrations 0010 and 0014
+            with override_settings(DATABASE_ROUTERS=[ScratchRouter()]):
+                call_command('migrate', database=ALIAS, verbosity=0, interactive=False)
+            category_ids, page_ids = self.seed(options['pages'])
+            return self.run_workers(category_ids, page_ids, use_queue, options)
+        finally:
+            connections[ALIAS].close()
+            del connections.databases[ALIAS]
+            if hasattr(connections._connections, ALIAS):
+                delattr(connections._connections, ALIAS)
+
+    def seed(self, pages):
+        Category.objects.using(ALIAS).bulk_create(
+            Category(name='Category {0}'.format(i), slug='category-{0}'.format(i)) for i in range(100))
+        category_ids = list(Category.objects.using(ALIAS).values_list('pk', flat=True))
+        Page.objects.using(ALIAS).bulk_create(
+            (Page(category_id=category_ids[i % len(category_ids)], title='Page {0}'.format(i),
+                  url='http://example.com/{0}'.format(i), views=i % 1013) for i in range(pages)),
+            batch_size=500)
+        return category_ids, list(Page.objects.using(ALIAS).values_list('pk', flat=True))
+
+    def run_workers(self, category_ids, page_ids, use_queue, options):
+        # Processes, like the server's workers, so that readers are not
+        # measuring the GIL; each writer process flushes from two threads.
+        deadline = time.time() + options['seconds']
+        results = multiprocessing.Queue()
+        connections.close_all()
+        workers = ([multiprocessing.Process(target=_read, args=(category_ids, deadline, results))
+                    for _ in range(options['readers'])] +
+                   [multiprocessing.Process(target=_write, args=(page_ids, deadline, use_queue, results))
+                    for _ in range(options['writers'])])
+        for worker in workers:
+            worker.start()
+        latencies = []
+        writes = read_failures = write_failures = 0
+        for _ in workers:
+            kind, values, failures = results.get()
+            if kind == 'read':
+                latencies.extend(values)
+                read_failures += failures
+            else:
+                writes += values
+                write_failures += failures
+        for worker in workers:
+            worker.join()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        return p50, p99, writes / options['seconds'], read_failures, write_failures
+
+
+def _read(category_ids, deadline, results):
+    latencies = []
+    failures = 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            list(Page.objects.using(ALIAS).filter(category_id=random.choice(category_ids))
+                 .order_by('-views', '-id')[:20])
+            list(Page.objects.using(ALIAS).order_by('-views')[:5])
+        except OperationalError:
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    connections[ALIAS].close()
+    results.put(('read', latencies, failures))
+
+
+def _increment(pks):
+    with transaction.atomic(using=ALIAS):
+        for pk in pks:
+            Page.objects.using(ALIAS).filter(pk=pk).update(views=F('views') + 1)
+
+
+def _write(page_ids, deadline, use_queue, results):
+    queue = WriteQueue(using=ALIAS) if use_queue else None
+    counts = {'writes': 0, 'failures': 0}
+    lock = threading.Lock()
+
+    def flush_repeatedly():
+        while time.time() < deadline:
+            # Like one flush of a counter buffer
+            pks = random.sample(page_ids, ROWS_PER_WRITE)
+            try:
+                if queue is not None:
+                    queue.run(lambda: _increment(pks))
+                else:
+                    _increment(pks)
+            except OperationalError:
+                with lock:
+                    counts['failures'] += 1
+                continue
+            with lock:
+                counts['writes'] += 1
+        connections[ALIAS].close()
+
+    threads = [threading.Thread(target=flush_repeatedly) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if queue is not None:
+        queue.close()
+    results.put(('write', counts['writes'], counts['failures']))
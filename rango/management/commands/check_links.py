@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rango.link_checker import LinkChecker, pages_to_check
+
+
+class Command(BaseCommand):
+    help = ('Checks that page URLs still work and records the results. '
+            'Run it from cron with --older-than to re-check pages a few at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Requests in flight at once.')
+        parser.add_argument('--per-host', type=int, help='Requests in flight to one host at once.')
+        parser.add_argument('--timeout', type=float, help='Seconds before a request is given up.')
+        parser.add_argument('--older-than', type=float, metavar='HOURS',
+                            help='Only check pages not checked in the last HOURS hours.')
+
+    def handle(self, *args, **options):
+        checked_before = None
+        if options['older_than'] is not None:
+            checked_before = timezone.now() - timedelta(hours=options['older_than'])
+        checker = LinkChecker(options['concurrency'], options['per_host'], options['timeout'])
+        checker.run(pages_to_check(checked_before))
+        self.stdout.write('Checked {0} pages: {1} healthy, {2} broken.'.format(
+            checker.checked, checker.healthy, checker.checked - checker.healthy))
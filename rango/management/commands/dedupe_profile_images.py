@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from rango import storage
+from rango.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Moves profile pictures uploaded before content-addressed storage to their digest names.'
+
+    def handle(self, *args, **options):
+        picture_storage = UserProfile._meta.get_field('picture').storage
+        names = [name for name in UserProfile.objects.exclude(picture='')
+                 .values_list('picture', flat=True).distinct()
+                 if not storage.is_content_addressed(name)]
+        moved = 0
+        for name in names:
+            if not picture_storage.exists(name):
+                self.stderr.write('Skipped {0}: file is missing'.format(name))
+                continue
+            with picture_storage.open(name) as original:
+                digest_name = picture_storage.save(name, original)
+            UserProfile.objects.filter(picture=name).update(picture=digest_name)
+            storage.release(name)
+            moved += 1
+        self.stdout.write('Moved {0} pictures to content-addressed names.'.format(moved))
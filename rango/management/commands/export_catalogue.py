@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from rango import exporter
+
+
+class Command(BaseCommand):
+    help = 'Streams every category with its pages as JSONL or CSV, optionally gzipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, or - for standard output.')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--since-category-id', type=int, default=0,
+                            help='Only export categories with a larger id (pages still bring theirs along). '
+                                 'Changes to older rows are not exported, see rango/exporter.py.')
+        parser.add_argument('--since-page-id', type=int, default=0,
+                            help='Only export pages with a larger id; changes to older pages are not exported.')
+
+    def handle(self, *args, **options):
+        last_category_id, last_page_id = exporter.high_water_marks()
+        blocks = exporter.export_blocks(options['format'], options['gzip'],
+                                        options['since_category_id'], options['since_page_id'])
+        out = sys.stdout.buffer if options['path'] == '-' else open(options['path'], 'wb')
+        try:
+            for block in blocks:
+                out.write(block)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        # Reported on stderr so that stdout stays a clean export
+        self.stderr.write('Next incremental export: --since-category-id {0} --since-page-id {1}'.format(
+            last_category_id, last_page_id))
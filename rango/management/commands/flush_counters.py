@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from rango import counters
+
+
+class Command(BaseCommand):
+    help = 'Writes buffered Page.views and Category.likes increments to the database.'
+
+    def handle(self, *args, **options):
+        # Our own buffer is flushed right away; running workers notice the
+        # request on their next increment and flush theirs.
+        flushed = counters.flush()
+        counters.request_flush()
+        self.stdout.write('Flushed {0} buffered increments, asked running workers to flush.'.format(flushed))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from rango import thumbnails
+from rango.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generates missing thumbnails and optimised variants for existing profile pictures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist.')
+
+    def handle(self, *args, **options):
+        pictures = (UserProfile.objects.exclude(picture='').values_list('picture', flat=True)
+                    .distinct().iterator())
+        generated = 0
+        for name in pictures:
+            try:
+                generated += thumbnails.generate(name, force=options['force'])
+            except (IOError, OSError) as e:
+                self.stderr.write('Skipped {0}: {1}'.format(name, e))
+        self.stdout.write('Wrote {0} picture variants.'.format(generated))
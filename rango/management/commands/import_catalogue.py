@@ -0,0 +1,34 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rango import importer
+
+
+class Command(BaseCommand):
+    help = 'Streams categories and pages from a JSONL or CSV file into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='Input format; guessed from the file extension when omitted.')
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE,
+                            help='Rows per transaction (default %(default)s).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if path == '-':
+            lines = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            try:
+                lines = open(path, encoding='utf-8', newline='')
+            except IOError as e:
+                raise CommandError(e)
+
+        reader = importer.read_csv if input_format == 'csv' else importer.read_jsonl
+        with lines:
+            stats = importer.import_rows(reader(lines), chunk_size=options['chunk_size'],
+                                         progress=lambda stats: self.stdout.write(str(stats)))
+        self.stdout.write(self.style.SUCCESS('Done: {0}'.format(stats)))
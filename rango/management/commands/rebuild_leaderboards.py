@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rango import leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the index page leaderboards (top categories by likes, top pages by views) from the database.'
+
+    def handle(self, *args, **options):
+        leaderboards.rebuild_all()
+        self.stdout.write('Rebuilt {0} category and {1} page leaderboard entries.'.format(
+            len(leaderboards.categories.entries()), len(leaderboards.pages.entries())))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from rango import local_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the local full-text search index over categories and pages.'
+
+    def handle(self, *args, **options):
+        if not local_search.is_available():
+            self.stdout.write('The local search index needs SQLite with FTS5, nothing to do.')
+            return
+        self.stdout.write('Indexed {0} categories and pages.'.format(local_search.rebuild()))
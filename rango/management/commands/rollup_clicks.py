@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rango import clicks
+
+
+class Command(BaseCommand):
+    help = 'Compacts the click log into hourly and daily buckets. Run it every few minutes from cron.'
+
+    def handle(self, *args, **options):
+        # This process's own buffer first, e.g. when run from a shell
+        clicks.flush()
+        self.stdout.write('Rolled up {0} clicks.'.format(clicks.rollup()))
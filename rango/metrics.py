@@ -0,0 +1,207 @@
+"""
+Per-view request metrics, exposed in the Prometheus text format.
+
+RequestMetricsMiddleware times every request and files it under the URL
+name it resolved to (or 'unresolved'). Alongside the wall time it records
+the number of database queries and the time spent in them (counted by the
+cursor wrapper in rango/backends/sqlite3) and the time spent rendering
+templates (rango/backends/templates.py). Each measurement goes into a
+fixed-bucket histogram, so recording is a bisect and an increment under a
+lock, and memory does not grow with traffic. The histograms are served by
+the metrics view.
+
+Other modules register the counters they keep themselves, such as the
+fragment cache's hits and misses (rango/caching.py), as Collected metrics
+that are read when the view is scraped.
+
+Histograms and counters live in process memory; with several worker
+processes every process must be scraped on its own.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.utils.deprecation import MiddlewareMixin
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+
+
+class Sample(object):
+    """What one request spent, filled in as it runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+
+def active_sample():
+    return getattr(_local, 'sample', None)
+
+
+def record_query(seconds, count=1):
+    sample = active_sample()
+    if sample is not None:
+        sample.queries += count
+        sample.db_seconds += seconds
+
+
+class template_timer(object):
+    """Times a render; nested renders are part of the outermost one."""
+
+    def __enter__(self):
+        self.sample = active_sample()
+        if self.sample is not None:
+            self.sample.template_depth += 1
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.sample is not None:
+            self.sample.template_depth -= 1
+            if self.sample.template_depth == 0:
+                self.sample.template_seconds += time.perf_counter() - self.started
+
+
+class Histogram(object):
+
+    def __init__(self, name, help_text, buckets, label_name='view'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_name = label_name
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                # per-bucket counts, with +Inf last, then the sum
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self, label):
+        """Returns (cumulative bucket counts, count, sum) for label."""
+        with self._lock:
+            counts, total = self._series.get(label, [[0] * (len(self.buckets) + 1), 0.0])
+            counts = list(counts)
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, total
+
+    def labels(self):
+        with self._lock:
+            return sorted(self._series)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def exposition(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.help_text),
+                 '# TYPE {0} histogram'.format(self.name)]
+        for label in self.labels():
+            cumulative, count, total = self.snapshot(label)
+            series = '{0}="{1}"'.format(self.label_name, _escape(label))
+            for bound, value in zip(self.buckets + ('+Inf',), cumulative):
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(self.name, series, bound, value))
+            lines.append('{0}_sum{{{1}}} {2!r}'.format(self.name, series, total))
+            lines.append('{0}_count{{{1}}} {2}'.format(self.name, series, count))
+        return '\n'.join(lines)
+
+
+class Collected(object):
+    """
+    A counter or gauge kept elsewhere. collect() returns (labels, value)
+    pairs, labels being a tuple of (name, value) pairs.
+    """
+
+    def __init__(self, name, help_text, kind, collect):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.collect = collect
+
+    def exposition(self):
+        lines = ['# HELP {0} {1}'.format(self.name, self.help_text),
+                 '# TYPE {0} {1}'.format(self.name, self.kind)]
+        for labels, value in sorted(self.collect()):
+            series = ','.join('{0}="{1}"'.format(name, _escape(label)) for name, label in labels)
+            lines.append('{0}{{{1}}} {2}'.format(self.name, series, value) if series
+                         else '{0} {1}'.format(self.name, value))
+        return '\n'.join(lines)
+
+
+def _escape(label):
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+duration = Histogram('rango_view_duration_seconds', 'Wall time per request.', SECONDS_BUCKETS)
+queries = Histogram('rango_view_db_queries', 'Database queries per request.', QUERY_BUCKETS)
+db_duration = Histogram('rango_view_db_duration_seconds', 'Time spent in database queries per request.',
+                        SECONDS_BUCKETS)
+template_duration = Histogram('rango_view_template_duration_seconds', 'Time spent rendering templates per request.',
+                              SECONDS_BUCKETS)
+# Observed by the password hashing pool, see rango/hashers.py
+password_hash_duration = Histogram('rango_password_hash_seconds', 'Time spent hashing one password.',
+                                   SECONDS_BUCKETS, label_name='algorithm')
+password_hash_wait = Histogram('rango_password_hash_wait_seconds',
+                               'Time a password waited for a hashing thread.', SECONDS_BUCKETS,
+                               label_name='algorithm')
+
+HISTOGRAMS = (duration, queries, db_duration, template_duration, password_hash_duration, password_hash_wait)
+_collected = []
+
+
+def register(collected):
+    """Adds a Collected metric to the exposition; returns it."""
+    _collected.append(collected)
+    return collected
+
+
+def observe(view, sample, elapsed):
+    duration.observe(view, elapsed)
+    queries.observe(view, sample.queries)
+    db_duration.observe(view, sample.db_seconds)
+    template_duration.observe(view, sample.template_seconds)
+
+
+def exposition():
+    return '\n'.join([histogram.exposition() for histogram in HISTOGRAMS] +
+                     [collected.exposition() for collected in _collected]) + '\n'
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """Goes first in MIDDLEWARE_CLASSES so that it sees the whole request."""
+
+    def process_request(self, request):
+        _local.sample = Sample()
+
+    def process_response(self, request, response):
+        sample = getattr(_local, 'sample', None)
+        if sample is None:
+            return response
+        _local.sample = None
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        observe(view, sample, time.perf_counter() - sample.started)
+        return response
+
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends run without the local search index.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE rango_search_index USING fts5(title, url, tokenize = 'unicode61')")
+    schema_editor.execute(
+        "INSERT INTO rango_search_index (rowid, title, url) "
+        "SELECT id * 2, name, '' FROM rango_category")
+    schema_editor.execute(
+        "INSERT INTO rango_search_index (rowid, title, url) "
+        "SELECT id * 2 + 1, title, url FROM rango_page")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE rango_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0005_userprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 16:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_name_prefix_index(apps, schema_editor):
+    # SQLite only uses an index for a case-insensitive LIKE 'x%'
+    # (name__istartswith) when the index is NOCASE too.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE INDEX rango_category_name_nocase_idx ON rango_category (name COLLATE NOCASE)')
+
+
+def drop_name_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP INDEX rango_category_name_nocase_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['-likes'], name='rango_category_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['-views'], name='rango_page_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['category', '-views'], name='rango_page_category_views_idx'),
+        ),
+        migrations.RunPython(create_name_prefix_index, drop_name_prefix_index),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 16:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import rango.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0008_keyset_page_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='picture',
+            field=models.ImageField(blank=True, db_index=True, storage=rango.storage.ContentAddressedStorage(), upload_to='profile_images'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from rango.canonical_urls import url_hash
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_url_hashes(apps, schema_editor):
+    Page = apps.get_model('rango', 'Page')
+    last_pk = 0
+    while True:
+        chunk = list(Page.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', 'url')[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        for pk, url in chunk:
+            Page.objects.filter(pk=pk).update(url_hash=url_hash(url))
+        last_pk = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0009_content_addressed_pictures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='url_hash',
+            field=models.CharField(default='', editable=False, max_length=40),
+        ),
+        migrations.RunPython(backfill_url_hashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['category', 'url_hash'], name='rango_page_cat_url_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0010_page_url_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkCheck',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='link_check', serialize=False, to='rango.Page')),
+                ('status', models.IntegerField(null=True)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('latency', models.FloatField(null=True)),
+                ('final_url', models.URLField(blank=True, max_length=2000)),
+                ('checked_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
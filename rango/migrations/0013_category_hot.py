@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_name_prefix_index(apps, schema_editor):
+    # Adding or removing a column makes SQLite rebuild rango_category, which
+    # drops the NOCASE index 0007 created outside the model state.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS rango_category_name_nocase_idx ON rango_category (name COLLATE NOCASE)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0012_click_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_name_prefix_index),
+        migrations.AddField(
+            model_name='category',
+            name='hot',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['-hot'], name='rango_category_hot_idx'),
+        ),
+        migrations.RunPython(create_name_prefix_index, migrations.RunPython.noop),
+    ]
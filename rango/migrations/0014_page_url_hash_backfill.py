@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from rango.canonical_urls import url_hash
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_missed_url_hashes(apps, schema_editor):
+    # 0010 backfilled through the database router, i.e. the default
+    # database, so a database migrated under another alias can still have
+    # pages without one.
+    Page = apps.get_model('rango', 'Page')
+    pages = Page.objects.using(schema_editor.connection.alias)
+    last_pk = 0
+    while True:
+        chunk = list(pages.filter(pk__gt=last_pk, url_hash='').order_by('pk')
+                     .values_list('pk', 'url')[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        for pk, url in chunk:
+            pages.filter(pk=pk).update(url_hash=url_hash(url))
+        last_pk = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0013_category_hot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_missed_url_hashes, migrations.RunPython.noop),
+    ]
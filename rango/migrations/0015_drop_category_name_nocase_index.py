@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def drop_name_prefix_index(apps, schema_editor):
+    # Category suggestions are answered from rango/prefix_index.py, so no
+    # query uses the NOCASE index 0007 and 0013 created outside the model
+    # state, and every rebuild of rango_category dropped it anyway.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS rango_category_name_nocase_idx')
+
+
+def create_name_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS rango_category_name_nocase_idx ON rango_category (name COLLATE NOCASE)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0014_page_url_hash_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_name_prefix_index, create_name_prefix_index),
+    ]
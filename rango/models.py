@@ -2,12 +2,19 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.template.defaultfilters import slugify
 
+from rango.canonical_urls import url_hash
+from rango.storage import profile_image_storage
+from rango.thumbnails import best_variant_url
+
 
 class Category(models.Model):
     name = models.CharField(max_length=128, unique=True)
     views = models.IntegerField(default=0)
     likes = models.IntegerField(default=0)
     slug = models.SlugField(unique=True)
+    # Log of the exponentially decayed like/click weight, see rango/hotness.py;
+    # null until the first like or click
+    hot = models.FloatField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
@@ -15,6 +22,12 @@ class Category(models.Model):
 
     class Meta:
         verbose_name_plural = 'categories'
+        indexes = [
+            # index page leaderboard: order_by('-likes')
+            models.Index(fields=['-likes'], name='rango_category_likes_idx'),
+            # hot categories: order_by('-hot')
+            models.Index(fields=['-hot'], name='rango_category_hot_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -25,16 +38,95 @@ class Page(models.Model):
     title = models.CharField(max_length=128)
     url = models.URLField()
     views = models.IntegerField(default=0)
+    # Hash of the canonical URL, see rango/canonical_urls.py. Kept up to
+    # date by save(); writers that bypass it must set it themselves.
+    url_hash = models.CharField(max_length=40, editable=False, default='')
+
+    def save(self, *args, **kwargs):
+        self.url_hash = url_hash(self.url)
+        super(Page, self).save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # index page leaderboard: order_by('-views')
+            models.Index(fields=['-views'], name='rango_page_views_idx'),
+            # pages of one category, most viewed first, keyset paginated on (views, id)
+            models.Index(fields=['category', '-views', '-id'], name='rango_page_cat_views_id_idx'),
+            # duplicate detection: filter(category=..., url_hash=...)
+            models.Index(fields=['category', 'url_hash'], name='rango_page_cat_url_hash_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class LinkCheck(models.Model):
+    """The latest link-health check of a page, see rango/link_checker.py."""
+    page = models.OneToOneField(Page, primary_key=True, related_name='link_check')
+    # HTTP status of the final response; null if no response came back
+    status = models.IntegerField(null=True)
+    error = models.CharField(max_length=200, blank=True)
+    latency = models.FloatField(null=True)  # seconds, redirects included
+    final_url = models.URLField(max_length=2000, blank=True)
+    checked_at = models.DateTimeField(db_index=True)
+
+    @property
+    def is_healthy(self):
+        return self.status is not None and self.status < 400
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.page_id, self.status or self.error)
+
+
+class ClickEvent(models.Model):
+    """
+    One click through track_url. Written in batches and compacted into
+    PageClicks/CategoryClicks by the rollup, see rango/clicks.py.
+    """
+    page = models.ForeignKey(Page)
+    category = models.ForeignKey(Category)
+    clicked_at = models.DateTimeField()
+
+
+class PageClicks(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIODS = ((HOUR, 'Hour'), (DAY, 'Day'))
+
+    period = models.CharField(max_length=4, choices=PERIODS)
+    start = models.DateTimeField()
+    page = models.ForeignKey(Page)
+    category = models.ForeignKey(Category)
+    clicks = models.IntegerField(default=0)
+
+    class Meta:
+        # Also serves the trending query: filter(period=..., start__gte=...)
+        unique_together = ('period', 'start', 'page')
+
+
+class CategoryClicks(models.Model):
+    period = models.CharField(max_length=4, choices=PageClicks.PERIODS)
+    start = models.DateTimeField()
+    category = models.ForeignKey(Category)
+    clicks = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('period', 'start', 'category')
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User)
 
     website = models.URLField(blank=True)
-    picture = models.ImageField(upload_to='profile_images', blank=True)
+    # Stored once per distinct content and shared between profiles,
+    # see rango/storage.py
+    picture = models.ImageField(upload_to='profile_images', blank=True, db_index=True,
+                                storage=profile_image_storage)
+
+    def picture_url_for(self, size):
+        # Smallest generated variant that is at least size pixels wide,
+        # see rango/thumbnails.py
+        return best_variant_url(self.picture.name, size) if self.picture else ''
 
     def __str__(self):
         return self.user.username
@@ -0,0 +1,66 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the sort key of its last row in an
+opaque, signed cursor and the next page asks for rows strictly after that
+key. With an index on the sort key every page costs the same as the first,
+however deep the reader goes, and rows inserted meanwhile never make a page
+repeat or skip entries. The ordering must end in a unique field (the
+primary key) so that it is total.
+"""
+from collections import namedtuple
+
+from django.core import signing
+from django.db.models import Q
+
+SALT = 'rango.pagination'
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    return signing.dumps(list(values), salt=SALT)
+
+
+def decode_cursor(cursor):
+    try:
+        return signing.loads(cursor, salt=SALT)
+    except signing.BadSignature:
+        raise InvalidCursor('Invalid or tampered cursor')
+
+
+def _after(ordering, values):
+    # (a, b) after (x, y) is a > x OR (a = x AND b > y), with the comparison
+    # flipped for descending fields.
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = '{0}__{1}'.format(name, 'lt' if field.startswith('-') else 'gt')
+        condition |= Q(**dict(equal, **{lookup: value}))
+        equal[name] = value
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor=None, size=20):
+    """
+    Returns the size rows of queryset that follow cursor (the first ones
+    when cursor is None) in the given ordering, plus the cursor for the
+    page after them, or None when there is none.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor('Cursor does not match the ordering')
+        queryset = queryset.filter(_after(ordering, values))
+    items = list(queryset[:size + 1])
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(getattr(items[-1], field.lstrip('-')) for field in ordering)
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,61 @@
+"""
+In-memory prefix index for category autocomplete.
+
+Each process keeps the category names, lowercased and sorted, next to their
+slugs and like counts. A prefix lookup is two bisections into that array,
+and the matches are ranked by likes without a database query. The array is
+loaded lazily and reloaded whenever the category version stamp (bumped by
+the Category save/delete signals) moves. Likes buffered by rango/counters.py
+don't bump the version, so the ranking reflects the likes as of the last
+category change.
+"""
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from rango.caching import get_version
+from rango.models import Category
+
+Suggestion = namedtuple('Suggestion', ['name', 'slug', 'likes'])
+
+# Sorts after any character a category name can contain.
+PREFIX_END = '\U0010ffff'
+
+
+class CategoryPrefixIndex(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._suggestions = []
+
+    def suggest(self, prefix, limit=8):
+        """
+        Returns up to limit categories whose name starts with prefix
+        (case-insensitively), most liked first. A limit of 0 returns all.
+        """
+        keys, suggestions = self._load()
+        prefix = prefix.lower()
+        start = bisect_left(keys, prefix)
+        end = bisect_right(keys, prefix + PREFIX_END, start)
+        matches = suggestions[start:end]
+        rank = lambda s: (-s.likes, s.name.lower())
+        if limit:
+            return heapq.nsmallest(limit, matches, key=rank)
+        return sorted(matches, key=rank)
+
+    def _load(self):
+        version = get_version('category')
+        with self._lock:
+            if version != self._version:
+                rows = sorted((name.lower(), Suggestion(name, slug, likes))
+                              for name, slug, likes in Category.objects.values_list('name', 'slug', 'likes'))
+                self._keys = [key for key, suggestion in rows]
+                self._suggestions = [suggestion for key, suggestion in rows]
+                self._version = version
+            return self._keys, self._suggestions
+
+
+categories = CategoryPrefixIndex()
@@ -0,0 +1,140 @@
+"""
+In-process result cache for Webhose searches.
+
+Results are kept per (normalised query, size) in a small LRU with a TTL.
+Concurrent misses for the same key share a single upstream call, and an
+entry that has expired but is still within the stale window is served as is
+while one background thread refreshes it. The Webhose cache's counts are
+scraped with the other metrics as rango_search_cache_lookups_total and
+rango_search_cache_entries, see rango/metrics.py.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from rango import metrics, webhose_search
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class _Entry(object):
+
+    def __init__(self, results, fetched_at):
+        self.results = results
+        self.fetched_at = fetched_at
+
+
+class _Flight(object):
+    """One upstream call that any number of callers can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class SearchCache(object):
+
+    def __init__(self, fetch, ttl=300, stale_ttl=3600, max_entries=500):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0}
+
+    def search(self, query, size=10):
+        key = (normalize_query(query), size)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry.results
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['stale_hits'] += 1
+                    if key not in self._flights:
+                        self._flights[key] = _Flight()
+                        threading.Thread(target=self._run_flight, args=(key, query, size), daemon=True).start()
+                    return entry.results
+                del self._entries[key]
+
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self._stats['misses'] += 1
+                leader = True
+            else:
+                self._stats['coalesced'] += 1
+                leader = False
+
+        if leader:
+            self._run_flight(key, query, size)
+        else:
+            flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = float(stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def lookup_samples(self):
+        stats = self.stats()
+        return [((('result', result),), stats[key]) for result, key in
+                (('hit', 'hits'), ('stale_hit', 'stale_hits'), ('miss', 'misses'), ('coalesced', 'coalesced'))]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def _run_flight(self, key, query, size):
+        with self._lock:
+            flight = self._flights[key]
+        try:
+            flight.results = self.fetch(query, size)
+        except Exception as e:
+            flight.error = e
+        with self._lock:
+            # run_query reports upstream errors as an empty list, so only
+            # real results are worth keeping.
+            if flight.error is None and flight.results:
+                self._entries[key] = _Entry(flight.results, time.time())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            del self._flights[key]
+        flight.event.set()
+
+
+webhose_cache = SearchCache(
+    lambda query, size: webhose_search.run_query(query, size),
+    ttl=getattr(settings, 'RANGO_SEARCH_CACHE_TTL', 300),
+    stale_ttl=getattr(settings, 'RANGO_SEARCH_CACHE_STALE_TTL', 3600),
+    max_entries=getattr(settings, 'RANGO_SEARCH_CACHE_MAX_ENTRIES', 500))
+metrics.register(metrics.Collected('rango_search_cache_lookups_total',
+                                   'Webhose search cache lookups, by result.', 'counter',
+                                   webhose_cache.lookup_samples))
+metrics.register(metrics.Collected('rango_search_cache_entries', 'Webhose searches cached.', 'gauge',
+                                   lambda: [((), webhose_cache.stats()['entries'])]))
+
+
+def search_webhose(query, size=10):
+    return webhose_cache.search(query, size)
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from rango import counters, leaderboards, local_search, storage, thumbnails
+from rango.caching import bump_version, category_namespace
+from rango.models import Category, Page, UserProfile
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # Invalidates the cached sidebar category list and the category's page
+    bump_version('category')
+    bump_version(category_namespace(instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    leaderboards.categories.offer(instance.pk, instance.likes)
+    local_search.index_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    leaderboards.categories.remove(instance.pk)
+    local_search.remove_category(instance.pk)
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_changed(sender, instance, **kwargs):
+    # Invalidates the cached page list of the page's category, and the
+    # index page's validator (it shows the most viewed page titles)
+    bump_version(category_namespace(instance.category_id))
+    bump_version('page')
+
+
+@receiver(counters.flushed, sender=Page)
+def page_counters_flushed(sender, field, pks, **kwargs):
+    # Buffered view counts change the order of the page lists
+    category_ids = set()
+    for start in range(0, len(pks), counters.UPDATE_CHUNK_SIZE):
+        category_ids.update(Page.objects.filter(pk__in=pks[start:start + counters.UPDATE_CHUNK_SIZE])
+                            .values_list('category_id', flat=True))
+    for category_id in category_ids:
+        bump_version(category_namespace(category_id))
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    leaderboards.pages.offer(instance.pk, instance.views)
+    local_search.index_page(instance)
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    leaderboards.pages.remove(instance.pk)
+    local_search.remove_page(instance.pk)
+
+
+def _release_on_commit(name):
+    # A rolled back delete must not lose a file that is still referenced
+    if name:
+        transaction.on_commit(lambda: storage.release(name))
+
+
+@receiver(pre_save, sender=UserProfile)
+def profile_saving(sender, instance, **kwargs):
+    instance._previous_picture = ''
+    if instance.pk:
+        instance._previous_picture = (UserProfile.objects.filter(pk=instance.pk)
+                                      .values_list('picture', flat=True).first() or '')
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    # Thumbnails are generated in the background; existing ones are kept
+    if instance.picture:
+        thumbnails.schedule(instance.picture.name)
+    previous = getattr(instance, '_previous_picture', '')
+    if previous != instance.picture.name:
+        _release_on_commit(previous)
+
+
+@receiver(post_delete, sender=UserProfile)
+def profile_deleted(sender, instance, **kwargs):
+    _release_on_commit(instance.picture.name)
@@ -0,0 +1,134 @@
+"""
+Content-addressed, deduplicated storage for uploaded profile pictures.
+
+An upload is hashed while it is streamed to a temporary file, then moved to
+<upload_to>/<first two hex digits>/<sha256><ext>. If a file with that digest
+is already there the copy is dropped, so identical avatars are stored once
+no matter how often they are uploaded. Since a name always refers to the
+same bytes, these files can be served with immutable cache headers.
+
+Files are shared between rows, so they are only deleted by release(), once
+no UserProfile refers to them any more. An upload that deduplicates onto an
+existing file touches it, and its row is only saved afterwards; release()
+leaves files touched less than RANGO_PROFILE_IMAGE_RELEASE_GRACE seconds
+ago alone so that it cannot delete one from under such an upload (at the
+price of leaving the rare file released in that window behind). The check
+and the delete hold a lock that uploads take too, an flock() on a file in
+the storage directory where the platform has one.
+
+Thumbnails (see rango/thumbnails.py) keep their names when regenerated, so
+only the digest names themselves are immutable.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DIGEST_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+LOCK_NAME = '.profile_images.lock'
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def _exclusive(storage):
+    """Serialises deduplicated saves and releases between threads and processes."""
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(storage.location, exist_ok=True)
+        with open(os.path.join(storage.location, LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Equal content means equal name; never rename
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        full_directory = self.path(directory)
+        if not os.path.isdir(full_directory):
+            os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temporary = tempfile.mkstemp(dir=full_directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+            hexdigest = digest.hexdigest()
+            final = os.path.join(directory, hexdigest[:2], hexdigest + extension)
+            full_final = self.path(final)
+            with _exclusive(self):
+                if os.path.exists(full_final):
+                    os.remove(temporary)
+                    # Keeps release() off it until our row is saved
+                    os.utime(full_final)
+                else:
+                    os.makedirs(os.path.dirname(full_final), exist_ok=True)
+                    # Atomic; two racing uploads of the same bytes write the same file
+                    os.replace(temporary, full_final)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(full_final, self.file_permissions_mode)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return final.replace('\\', '/')
+
+
+def is_content_addressed(name):
+    return bool(DIGEST_NAME.search(name))
+
+
+def release(name, exclude_pk=None):
+    """
+    Deletes a stored picture and its thumbnails when no UserProfile other
+    than exclude_pk refers to it any more. Returns whether it was deleted.
+    """
+    from rango import thumbnails
+    from rango.models import UserProfile
+    if not name:
+        return False
+    references = UserProfile.objects.filter(picture=name)
+    if exclude_pk is not None:
+        references = references.exclude(pk=exclude_pk)
+    storage = UserProfile._meta.get_field('picture').storage
+    grace = getattr(settings, 'RANGO_PROFILE_IMAGE_RELEASE_GRACE', 60)
+    with _exclusive(storage):
+        if references.exists():
+            return False
+        if (is_content_addressed(name) and storage.exists(name) and
+                time.time() - os.path.getmtime(storage.path(name)) < grace):
+            # An upload of the same bytes may be about to refer to it
+            return False
+        for stored in [name] + thumbnails.variant_names(name):
+            if storage.exists(stored):
+                storage.delete(stored)
+    return True
+
+
+profile_image_storage = ContentAddressedStorage()
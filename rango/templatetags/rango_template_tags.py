@@ -1,12 +1,25 @@
 from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from rango.caching import cached_fragment
 from rango.models import Category
 
 register = template.Library()
 
 
 # template Tags
-@register.inclusion_tag('rango/cats.html')
+@register.simple_tag
 def get_category_list(cat=None):
-    return {'cats': Category.objects.all(),
-            'act_cat': cat}
+    # The rendered list is cached per category-table version (bumped by the
+    # Category save/delete signals) and per highlighted category.
+    def render():
+        return render_to_string('rango/cats.html', {'cats': Category.objects.all(),
+                                                    'act_cat': cat})
 
+    active = getattr(cat, 'pk', None) or 'none'
+    return mark_safe(cached_fragment('category_list', 'category', active, render))
+
+
+@register.simple_tag
+def profile_picture_url(userprofile, size):
+    return userprofile.picture_url_for(int(size))
@@ -0,0 +1,21 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class RangoTestRunner(DiscoverRunner):
+    """
+    Runs the tests against a private in-memory cache rather than the file
+    cache the workers share, so that runs neither see each other's entries
+    nor those of a running server.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(RangoTestRunner, self).setup_test_environment(**kwargs)
+        self._cache_settings = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        super(RangoTestRunner, self).teardown_test_environment(**kwargs)
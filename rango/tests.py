@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.core.urlresolvers import reverse
 from django.contrib.staticfiles import finders
 
@@ -248,3 +248,1692 @@ class Chapter7ViewTests(TestCase):
 
 
     # test if the add_page.html template exists.
+
+
+class CounterBufferTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.category = Category.objects.create(name='Buffered', likes=3)
+        self.page = Page.objects.create(category=self.category, title='Buffered page',
+                                        url='http://example.com/', views=5)
+
+    def tearDown(self):
+        from rango import clicks, counters, hotness
+        counters.flush()
+        clicks.flush()
+        hotness.flush()
+
+    def test_track_url_is_written_back_on_flush(self):
+        from rango import counters
+        from rango.models import Page
+        for i in range(3):
+            self.client.get(reverse('goto'), {'page_id': self.page.id})
+        # Nothing hits the database until the buffer is flushed
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 5)
+        self.assertEqual(counters.flush(), 3)
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 8)
+
+    def test_threshold_triggers_flush(self):
+        from rango.counters import CounterBuffer
+        from rango.models import Category
+        buffer = CounterBuffer(interval=0, threshold=2)
+        buffer.incr(Category, self.category.id, 'likes')
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 3)
+        buffer.incr(Category, self.category.id, 'likes')
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 5)
+        self.assertEqual(buffer.pending(Category, self.category.id, 'likes'), 0)
+
+    def test_request_flush_reaches_other_buffers_through_the_cache(self):
+        from unittest import mock
+        from rango import counters
+        from rango.models import Category
+        # A key of its own, or this process's buffer would flush mid-test later on
+        with mock.patch.object(counters, 'FLUSH_REQUEST_KEY', 'rango:test:flush_request'):
+            worker = counters.CounterBuffer(interval=0, threshold=0, poll_interval=0)
+            worker.incr(Category, self.category.id, 'likes')
+            self.assertEqual(Category.objects.get(id=self.category.id).likes, 3)
+            counters.request_flush()
+            worker.incr(Category, self.category.id, 'likes')
+            self.assertEqual(Category.objects.get(id=self.category.id).likes, 5)
+
+    def test_idle_buffers_answer_flush_requests(self):
+        import threading
+        from unittest import mock
+        from rango import counters
+        from rango.models import Category
+        flushed = threading.Event()
+        with mock.patch.object(counters, 'FLUSH_REQUEST_KEY', 'rango:test:idle_flush_request'):
+            worker = counters.CounterBuffer(interval=0, threshold=0, poll_interval=0.05)
+            worker.incr(Category, self.category.id, 'likes')
+            # The timer's flush runs on its own connection, outside this test's transaction
+            worker.flush = flushed.set
+            counters.request_flush()
+            # No further increment: the poll timer notices the request
+            self.assertTrue(flushed.wait(5))
+            # Empties the buffer here, which stops its polling
+            del worker.flush
+            worker.flush()
+
+    def test_project_cache_is_shared_between_processes(self):
+        # The test runner swaps in a LocMemCache; the workers must not use one
+        from tango_with_django_project import settings
+        self.assertNotIn('locmem', settings.CACHES['default']['BACKEND'])
+
+
+class CategoryListCacheTests(TestCase):
+
+    def render_sidebar(self, cat=None):
+        from django.template import Context, Template
+        template = Template('{% load rango_template_tags %}{% get_category_list cat %}')
+        return template.render(Context({'cat': cat}))
+
+    def test_sidebar_is_cached_until_a_category_changes(self):
+        from rango.caching import stats
+        from rango.models import Category
+        stats.reset()
+        Category.objects.create(name='First')
+        self.assertIn('First', self.render_sidebar())
+        self.assertIn('First', self.render_sidebar())
+        self.assertEqual(stats.snapshot()['category_list'], {'hits': 1, 'misses': 1})
+
+        # Saving a category bumps the version, so the next render is fresh
+        Category.objects.create(name='Second')
+        self.assertIn('Second', self.render_sidebar())
+        self.assertEqual(stats.snapshot()['category_list']['misses'], 2)
+
+        # Scraped along with the request metrics
+        exposition = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('rango_fragment_cache_lookups_total{fragment="category_list",result="hit"} 1', exposition)
+        self.assertIn('rango_fragment_cache_lookups_total{fragment="category_list",result="miss"} 2', exposition)
+
+    def test_active_category_is_highlighted(self):
+        from rango.models import Category
+        first = Category.objects.create(name='First')
+        Category.objects.create(name='Second')
+        self.assertNotIn('<strong>', self.render_sidebar())
+        self.assertIn('<strong> <a href="/rango/category/first/">First', self.render_sidebar(first))
+
+    def test_evicted_version_does_not_revive_old_fragments(self):
+        from django.core.cache import cache
+        from rango.caching import VERSION_KEY, get_version
+        from rango.models import Category
+        Category.objects.create(name='First')
+        self.assertIn('First', self.render_sidebar())
+        old_version = get_version('category')
+        # The version is culled, the fragment cached under it is not
+        cache.delete(VERSION_KEY.format('category'))
+        Category.objects.filter(name='First').update(name='Renamed')
+        self.assertGreater(get_version('category'), old_version)
+        self.assertIn('Renamed', self.render_sidebar())
+
+
+class SharedCacheTests(TestCase):
+    # Against the cache the workers share, not the test runner's LocMemCache
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from tango_with_django_project import settings as project_settings
+        self.location = tempfile.mkdtemp()
+        self.config = dict(project_settings.CACHES['default'], LOCATION=self.location)
+        self.settings_override = override_settings(CACHES={'default': self.config})
+        self.settings_override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.location)
+
+    def use_options(self, **options):
+        from django.test import override_settings
+        self.settings_override.disable()
+        config = dict(self.config, OPTIONS=dict(self.config['OPTIONS'], **options))
+        self.settings_override = override_settings(CACHES={'default': config})
+        self.settings_override.enable()
+
+    def test_versions_do_not_expire(self):
+        import time
+        from unittest import mock
+        from rango.caching import bump_version, get_version
+        old = get_version('shared')
+        new = bump_version('shared')
+        self.assertGreater(new, old)
+        with mock.patch('django.core.cache.backends.filebased.time.time', return_value=time.time() + 86400):
+            self.assertEqual(get_version('shared'), new)
+
+    def test_sets_do_not_list_the_directory_each_time(self):
+        import os
+        from unittest import mock
+        from django.core.cache import cache
+        with mock.patch('rango.backends.filecache.os.scandir', wraps=os.scandir) as scandir:
+            for i in range(50):
+                cache.set('key{0}'.format(i), i)
+        self.assertLessEqual(scandir.call_count, 1)
+        self.assertEqual(cache.get('key49'), 49)
+
+    def test_culling_keeps_recently_written_entries(self):
+        import os
+        import time
+        from django.core.cache import cache
+        from rango import throttle
+        self.use_options(MAX_ENTRIES=30, CULL_INTERVAL=0)
+        for i in range(40):
+            cache.set('fragment{0}'.format(i), i)
+        for name in os.listdir(self.location):
+            os.utime(os.path.join(self.location, name), (time.time() - 3600,) * 2)
+        self.assertEqual(throttle.take('login', [('username', 'victim')]), 0)
+        for i in range(5):
+            cache.set('more{0}'.format(i), i)
+        self.assertLess(len(os.listdir(self.location)), 45)
+        self.assertIsNotNone(cache.get(throttle._key('login', 'username', 'victim')))
+        self.assertEqual(cache.get('more4'), 4)
+
+
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        from rango import leaderboards
+        from rango.models import Category
+        for i in range(7):
+            Category.objects.create(name='Category {0}'.format(i), likes=i * 10)
+        leaderboards.rebuild_all()
+
+    def tearDown(self):
+        from rango import counters, hotness
+        counters.flush()
+        hotness.flush()
+
+    def test_index_shows_top_five_without_sorting(self):
+        response = self.client.get(reverse('index'))
+        names = [c.name for c in response.context['categories']]
+        self.assertEqual(names, ['Category 6', 'Category 5', 'Category 4', 'Category 3', 'Category 2'])
+
+    def test_new_row_enters_board(self):
+        from rango import leaderboards
+        from rango.models import Category
+        top = Category.objects.create(name='Newcomer', likes=1000)
+        self.assertEqual(leaderboards.categories.entries()[0], (1000, top.id))
+        self.assertEqual(len(leaderboards.categories.entries()), 5)
+
+    def test_increment_moves_row_up(self):
+        from django.contrib.auth.models import User
+        from rango import leaderboards
+        from rango.models import Category
+        User.objects.create_user('liker', password='secret')
+        self.client.login(username='liker', password='secret')
+        cat = Category.objects.get(name='Category 1')
+        Category.objects.filter(id=cat.id).update(likes=59)
+        self.client.get(reverse('like_category'), {'category_id': cat.id})
+        self.assertEqual(leaderboards.categories.entries()[0], (60, cat.id))
+
+    def test_board_is_rebuilt_after_its_ttl(self):
+        import time
+        from unittest import mock
+        from django.test import override_settings
+        from rango import leaderboards
+        from rango.models import Category
+        with override_settings(RANGO_LEADERBOARD_TTL=60):
+            leaderboards.categories.rebuild()
+            # Flushed by another process: this process's board never hears of it
+            cat = Category.objects.get(name='Category 1')
+            Category.objects.filter(id=cat.id).update(likes=500)
+            leaderboards.categories.record_increment(cat.id, 0)
+            self.assertNotEqual(leaderboards.categories.entries()[0], (500, cat.id))
+            with mock.patch('rango.leaderboards.time.time', return_value=time.time() + 61):
+                self.assertEqual(leaderboards.categories.entries()[0], (500, cat.id))
+
+    def test_deleting_a_member_rebuilds(self):
+        from rango import leaderboards
+        from rango.models import Category
+        Category.objects.get(name='Category 6').delete()
+        names = [c.name for c in leaderboards.categories.objects()]
+        self.assertEqual(names, ['Category 5', 'Category 4', 'Category 3', 'Category 2', 'Category 1'])
+
+
+class SearchCacheTests(TestCase):
+
+    def test_normalised_queries_share_an_entry(self):
+        from rango.search_cache import SearchCache
+        calls = []
+
+        def fetch(query, size):
+            calls.append(query)
+            return [{'title': query, 'link': 'http://example.com/', 'summary': ''}]
+
+        cache = SearchCache(fetch)
+        cache.search('Django  Tutorial')
+        cache.search(' django tutorial ')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_concurrent_misses_are_coalesced(self):
+        import threading
+        import time
+        from rango.search_cache import SearchCache
+        release = threading.Event()
+        calls = []
+
+        def fetch(query, size):
+            calls.append(query)
+            release.wait(5)
+            return [{'title': query, 'link': 'http://example.com/', 'summary': ''}]
+
+        cache = SearchCache(fetch)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.search('python'))) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()['misses'] + cache.stats()['coalesced'] < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 4)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        from rango.search_cache import SearchCache
+        calls = []
+
+        def fetch(query, size):
+            calls.append(query)
+            return [{'title': str(len(calls)), 'link': 'http://example.com/', 'summary': ''}]
+
+        cache = SearchCache(fetch, ttl=0, stale_ttl=60)
+        self.assertEqual(cache.search('rango')[0]['title'], '1')
+        self.assertEqual(cache.search('rango')[0]['title'], '1')
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+    def test_webhose_cache_counts_are_exported(self):
+        from unittest import mock
+        from rango import metrics, search_cache
+        search_cache.webhose_cache.clear()
+        try:
+            with mock.patch('rango.webhose_search.run_query', return_value=[{'title': 'Python'}]):
+                search_cache.search_webhose('python')
+                search_cache.search_webhose('Python')
+            exposition = metrics.exposition()
+        finally:
+            search_cache.webhose_cache.clear()
+        self.assertIn('rango_search_cache_lookups_total{result="hit"} 1', exposition)
+        self.assertIn('rango_search_cache_lookups_total{result="miss"} 1', exposition)
+        self.assertIn('rango_search_cache_lookups_total{result="stale_hit"} 0', exposition)
+        self.assertIn('rango_search_cache_entries 1', exposition)
+
+
+class WebhoseClientTests(TestCase):
+
+    def setUp(self):
+        import json
+        import os
+        import tempfile
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+        from urllib.parse import parse_qs, urlsplit
+        self.requests = requests = []
+
+        class StandIn(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                params = parse_qs(urlsplit(self.path).query)
+                requests.append(params)
+                if self.server.status != 200:
+                    self.send_response(self.server.status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                offset, size = int(params['from'][0]), int(params['size'][0])
+                posts = [{'title': 'Result {0}'.format(i), 'url': 'http://example.com/{0}'.format(i),
+                          'text': params['token'][0]} for i in range(offset, offset + size)]
+                body = json.dumps({'posts': posts}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class ThreadingServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = ThreadingServer(('127.0.0.1', 0), StandIn)
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        fd, self.key_path = tempfile.mkstemp()
+        os.write(fd, b'first-key\n')
+        os.close(fd)
+
+    def tearDown(self):
+        import os
+        self.server.shutdown()
+        self.server.server_close()
+        os.remove(self.key_path)
+
+    def webhose_client(self, **kwargs):
+        from rango.webhose_search import WebhoseClient
+        return WebhoseClient(key_path=self.key_path, root_url='http://127.0.0.1:{0}/search'.format(
+            self.server.server_port), **kwargs)
+
+    def test_pages_are_fetched_concurrently_and_merged_in_order(self):
+        results = self.webhose_client(page_size=3).search('rango', size=8)
+        self.assertEqual([r['title'] for r in results], ['Result {0}'.format(i) for i in range(8)])
+        self.assertEqual(sorted(int(r['from'][0]) for r in self.requests), [0, 3, 6])
+
+    def test_key_is_reloaded_when_the_file_changes(self):
+        import os
+        client = self.webhose_client()
+        self.assertEqual(client.search('rango', size=1)[0]['summary'], 'first-key')
+        with open(self.key_path, 'w') as f:
+            f.write('second-key\n')
+        os.utime(self.key_path, (0, 0))
+        self.assertEqual(client.search('rango', size=1)[0]['summary'], 'second-key')
+
+    def test_retries_stop_when_the_budget_is_spent(self):
+        import time
+        from rango.webhose_search import WebhoseError
+        self.server.status = 503
+        client = self.webhose_client(retries=10, backoff=0.1, budget=0.5)
+        started = time.monotonic()
+        with self.assertRaises(WebhoseError):
+            client.search('rango', size=1)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertLess(len(self.requests), 11)
+
+
+class LocalSearchTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        Page.objects.create(category=self.django, title='Official Django Tutorial',
+                            url='https://docs.djangoproject.com/en/1.9/intro/tutorial01/')
+        Page.objects.create(category=self.python, title='Learn Python in 10 Minutes',
+                            url='http://www.korokithakis.net/tutorials/python/')
+
+    def test_index_follows_saves_and_deletes(self):
+        from rango import local_search
+        titles = [r['title'] for r in local_search.search('python')]
+        self.assertEqual(titles[0], 'Python')
+        self.assertIn('Learn Python in 10 Minutes', titles)
+
+        self.python.name = 'Snakes'
+        self.python.save()
+        self.assertNotIn('Python', [r['title'] for r in local_search.search('python')])
+        self.django.delete()
+        self.assertEqual(local_search.search('official'), [])
+
+    def test_last_word_matches_as_prefix(self):
+        from rango import local_search
+        self.assertEqual([r['title'] for r in local_search.search('django tut')], ['Official Django Tutorial'])
+
+    def test_rebuild(self):
+        from rango import local_search
+        self.assertEqual(local_search.rebuild(), 4)
+        self.assertEqual(len(local_search.search('korokithakis')), 1)
+
+    def test_search_view_without_network(self):
+        response = self.client.post(reverse('search'), {'query': 'django', 'source': 'local'})
+        self.assertEqual(response.context['result_list'], [])
+        self.assertEqual(response.context['local_result_list'][0]['title'], 'Django')
+
+
+class CategoryPrefixIndexTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category
+        for name, likes in [('Pascal', 16), ('Perl', 32), ('Php', 8), ('Python', 64), ('Django', 100)]:
+            Category.objects.create(name=name, likes=likes)
+
+    def test_matches_ranked_by_likes(self):
+        from rango import prefix_index
+        names = [s.name for s in prefix_index.categories.suggest('p', 3)]
+        self.assertEqual(names, ['Python', 'Perl', 'Pascal'])
+        self.assertEqual([s.name for s in prefix_index.categories.suggest('PE')], ['Perl'])
+
+    def test_suggest_view_does_not_query(self):
+        from rango import prefix_index
+        prefix_index.categories.suggest('p')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('suggest_category'), {'suggestion': 'py'})
+        self.assertIn(b'/rango/category/python/', response.content)
+
+    def test_new_category_is_picked_up(self):
+        from rango import prefix_index
+        from rango.models import Category
+        prefix_index.categories.suggest('p')
+        Category.objects.create(name='Prolog', likes=1000)
+        self.assertEqual(prefix_index.categories.suggest('p', 1)[0].name, 'Prolog')
+
+
+class QueryPlanTests(TestCase):
+    # Seeds a large catalogue, requests the hot views and checks with EXPLAIN
+    # QUERY PLAN that every query they send to the rango tables is answered
+    # from an index: no full table scan and no temporary B-tree to sort.
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.db import connection
+        from rango.canonical_urls import url_hash
+        from rango.models import Category, Page
+        if connection.vendor != 'sqlite':
+            return
+        Category.objects.bulk_create(
+            Category(name='Category {0}'.format(i), slug='category-{0}'.format(i), likes=i % 97)
+            for i in range(2000))
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        Page.objects.bulk_create(
+            Page(category_id=category_ids[i % len(category_ids)], title='Page {0}'.format(i),
+                 url='http://example.com/{0}'.format(i), url_hash=url_hash('http://example.com/{0}'.format(i)),
+                 views=i % 1013)
+            for i in range(20000))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.category = Category.objects.get(slug='category-7')
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN checks are written for SQLite')
+        # Nothing served from cached fragments or leaderboards
+        cache.clear()
+
+    def tearDown(self):
+        from rango import counters, hotness
+        counters.flush()
+        hotness.flush()
+
+    def assertViewUsesIndexes(self, request):
+        """Runs request() and checks the plan of every rango query it sent."""
+        import re
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        selects = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and '"rango_' in query['sql']]
+        self.assertTrue(selects)
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql.replace('%', '%%'))
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                # "SCAN rango_page" alone is a full table scan; walking an
+                # index in order reads "SCAN rango_page USING INDEX ..."
+                self.assertIsNone(re.match(r'^SCAN (TABLE )?\w+$', step), (sql, plan))
+                self.assertNotIn('TEMP B-TREE', step, (sql, plan))
+        return response
+
+    def test_index(self):
+        self.assertViewUsesIndexes(lambda: self.client.get(reverse('index')))
+
+    def test_show_category(self):
+        self.assertViewUsesIndexes(lambda: self.client.get(reverse('show_category', args=['category-7'])))
+
+    def test_more_category_pages(self):
+        from rango.models import Page
+        from rango.pagination import keyset_page
+        cursor = keyset_page(Page.objects.filter(category=self.category), ['-views', '-id'], None, 2).next_cursor
+        self.assertViewUsesIndexes(lambda: self.client.get(
+            reverse('more_category_pages'), {'category_id': self.category.id, 'cursor': cursor}))
+
+    def test_duplicate_page_lookup(self):
+        response = self.assertViewUsesIndexes(lambda: self.client.post(
+            reverse('add_page', args=['category-7']),
+            {'title': 'Again', 'url': 'http://example.com/7', 'views': 0}))
+        self.assertContains(response, 'This category already has that page.')
+
+    def test_category_name_nocase_index_is_gone(self):
+        from django.db import connection
+        # Served no view once suggestions moved to rango/prefix_index.py
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s",
+                           ['rango_category_name_nocase_idx'])
+            self.assertIsNone(cursor.fetchone())
+
+
+class ImporterTests(TestCase):
+
+    def test_csv_import_creates_and_upserts(self):
+        import io
+        from rango import importer
+        from rango.models import Category, Page
+        data = io.StringIO(
+            'category,category_views,category_likes,title,url,views\n'
+            'Python,128,64,Official Python Tutorial,http://docs.python.org/2/tutorial/,32\n'
+            'Python,,,Learn Python in 10 Minutes,http://www.korokithakis.net/tutorials/python/,8\n'
+            'Pascal,32,16,,,\n')
+        stats = importer.import_rows(importer.read_csv(data), chunk_size=2)
+        self.assertEqual((stats.categories_created, stats.pages_created), (2, 2))
+        self.assertEqual(Category.objects.get(slug='python').likes, 64)
+
+        # Re-importing updates in place instead of duplicating
+        data = io.StringIO('{"category": "Python", "title": "Official Python Tutorial", "views": 40}\n')
+        stats = importer.import_rows(importer.read_jsonl(data))
+        self.assertEqual((stats.pages_created, stats.pages_updated), (0, 1))
+        self.assertEqual(Page.objects.get(title='Official Python Tutorial').views, 40)
+        self.assertEqual(Page.objects.count(), 2)
+
+    def test_imported_rows_are_searchable(self):
+        from rango import importer, local_search
+        importer.import_rows([{'category': 'Django', 'title': 'Django Rocks', 'url': 'http://www.djangorocks.com/'}])
+        self.assertEqual([r['title'] for r in local_search.search('rocks')], ['Django Rocks'])
+
+    def test_versions_are_bumped_after_each_chunk_commits(self):
+        from unittest import mock
+        from django.db import connection
+        from rango import importer
+        from rango.caching import bump_version, category_namespace
+        from rango.models import Category
+        depth = len(connection.savepoint_ids)
+        bumps = []
+
+        def record(namespace):
+            bumps.append((namespace, len(connection.savepoint_ids)))
+            return bump_version(namespace)
+
+        with mock.patch('rango.importer.bump_version', side_effect=record):
+            importer.import_rows([{'category': 'Python', 'title': 'Tutorial', 'url': 'http://docs.python.org/'}])
+        category = Category.objects.get(slug='python')
+        self.assertIn((category_namespace(category.pk), depth), bumps)
+        # None from inside the chunk's atomic block
+        self.assertEqual(set(d for namespace, d in bumps), {depth})
+
+    def test_populate_is_query_light(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from populate_rango import populate
+        # 8 categories and 8 pages used to take 50+ queries
+        with CaptureQueriesContext(connection) as queries:
+            populate()
+        self.assertLess(len(queries), 20)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rango import importer
+        importer.import_rows([
+            {'category': 'Python', 'category_likes': 64, 'title': 'Official Python Tutorial',
+             'url': 'http://docs.python.org/2/tutorial/', 'views': 32},
+            {'category': 'Pascal', 'category_likes': 16},
+            {'category': 'Python', 'title': 'Learn Python in 10 Minutes',
+             'url': 'http://www.korokithakis.net/tutorials/python/', 'views': 8},
+        ])
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def test_jsonl_export_round_trips_through_the_importer(self):
+        import json
+        from rango import exporter
+        rows = [json.loads(line) for line in b''.join(exporter.export_blocks()).decode('utf-8').splitlines()]
+        self.assertEqual([(r['category'], r.get('title')) for r in rows],
+                         [('Python', 'Official Python Tutorial'), ('Python', 'Learn Python in 10 Minutes'),
+                          ('Pascal', None)])
+        self.assertEqual(rows[0]['category_likes'], 64)
+
+    def test_incremental_export(self):
+        from rango import exporter
+        from rango.models import Category, Page
+        last_category_id, last_page_id = exporter.high_water_marks()
+        Page.objects.create(category=Category.objects.get(slug='pascal'), title='Free Pascal',
+                            url='https://www.freepascal.org/')
+        rows = list(exporter.export_rows(last_category_id, last_page_id))
+        self.assertEqual([(r['category'], r['title']) for r in rows], [('Pascal', 'Free Pascal')])
+
+    def test_streaming_gzip_csv_view(self):
+        import gzip
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(reverse('export_catalogue'), {'format': 'csv', 'gzip': '1'})
+        self.assertTrue(response.streaming)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'category,category_views,category_likes,title,url,views')
+        self.assertEqual(len(lines), 4)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.category = Category.objects.create(name='Paged')
+        for i in range(7):
+            # Two pages per view count, so ties have to be broken on id
+            Page.objects.create(category=self.category, title='Page {0}'.format(i),
+                                url='http://example.com/{0}'.format(i), views=i // 2)
+
+    def test_pages_follow_each_other_without_gaps(self):
+        from rango.models import Page
+        from rango.pagination import keyset_page
+        pages = Page.objects.filter(category=self.category)
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_page(pages, ['-views', '-id'], cursor, size=3)
+            seen.extend(page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(pages.order_by('-views', '-id')))
+
+    def test_tampered_cursor_is_rejected(self):
+        from rango.models import Page
+        from rango.pagination import InvalidCursor, encode_cursor, keyset_page
+        cursor = encode_cursor([1, 2])
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Page.objects.all(), ['-views', '-id'], cursor[:-1] + 'x')
+
+    def test_more_pages_fragment(self):
+        from django.test import override_settings
+        with override_settings(RANGO_PAGES_PER_FRAGMENT=5):
+            from rango.models import Page
+            from rango.pagination import keyset_page
+            response = self.client.get(reverse('show_category', args=['paged']))
+            self.assertEqual(response.content.count(b'<li><a href'), 5)
+            cursor = keyset_page(Page.objects.filter(category=self.category), ['-views', '-id'], None, 5).next_cursor
+            response = self.client.get(reverse('more_category_pages'),
+                                       {'category_id': self.category.id, 'cursor': cursor})
+        self.assertIn(b'Page 1', response.content)
+        self.assertIn(b'Page 0', response.content)
+        self.assertNotIn(b'Page 2', response.content)
+        self.assertNotIn(b'More pages', response.content)
+
+    def test_more_pages_of_a_bad_category_id_is_a_404(self):
+        for category_id in ('abc', '', '1.5', str(self.category.id + 1000)):
+            response = self.client.get(reverse('more_category_pages'), {'category_id': category_id})
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse('more_category_pages')).status_code, 404)
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def make_profile(self):
+        import io
+        from django.contrib.auth.models import User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        from rango.models import UserProfile
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), 'orange').save(buffer, 'PNG')
+        user = User.objects.create_user('pictured', password='secret')
+        return UserProfile.objects.create(
+            user=user, picture=SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png'))
+
+    def test_variants_are_generated_and_preferred(self):
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        from rango import thumbnails
+        profile = self.make_profile()
+        name = profile.picture.name
+        stem = '{0}/thumbs/{1}'.format(*name[:-len('.png')].rsplit('/', 1))
+        # Until the background job has run, the original is served
+        self.assertEqual(profile.picture_url_for(64), '/media/' + name)
+
+        self.assertEqual(thumbnails.generate(name), 4)
+        self.assertEqual(profile.picture_url_for(50), '/media/{0}_64.png'.format(stem))
+        self.assertEqual(profile.picture_url_for(200), '/media/{0}_256.png'.format(stem))
+        self.assertEqual(profile.picture_url_for(2000), '/media/{0}_opt.png'.format(stem))
+        with default_storage.open('{0}_128.png'.format(stem)) as f:
+            self.assertEqual(Image.open(f).size, (128, 128))
+        # Nothing left to do the second time round
+        self.assertEqual(thumbnails.generate(name), 0)
+
+    def test_backfill_command(self):
+        from django.core.files.storage import default_storage
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        from rango import thumbnails
+        profile = self.make_profile()
+        call_command('generate_thumbnails', stdout=StringIO())
+        self.assertTrue(default_storage.exists(thumbnails.variant_name(profile.picture.name, 256)))
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def make_profile(self, username, data, filename='avatar.png'):
+        from django.contrib.auth.models import User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from rango.models import UserProfile
+        user = User.objects.create_user(username, password='secret')
+        return UserProfile.objects.create(
+            user=user, picture=SimpleUploadedFile(filename, data, content_type='image/png'))
+
+    def test_identical_uploads_are_stored_once(self):
+        import hashlib
+        import os
+        first = self.make_profile('first', b'same bytes', 'one.PNG')
+        second = self.make_profile('second', b'same bytes', 'two.png')
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(first.picture.name, 'profile_images/{0}/{1}.png'.format(digest[:2], digest))
+        self.assertEqual(second.picture.name, first.picture.name)
+        stored = os.listdir(os.path.join(self.media_root, 'profile_images', digest[:2]))
+        self.assertEqual(stored, [digest + '.png'])
+        self.assertNotEqual(self.make_profile('third', b'other bytes').picture.name, first.picture.name)
+
+    def test_release_keeps_shared_files(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from rango import storage, thumbnails
+        from rango.models import UserProfile
+        picture_storage = UserProfile._meta.get_field('picture').storage
+        first = self.make_profile('first', b'shared')
+        second = self.make_profile('second', b'shared')
+        name = first.picture.name
+        default_storage.save(thumbnails.variant_name(name, 64), ContentFile(b'thumb'))
+        self.assertTrue(picture_storage.exists(thumbnails.variant_name(name, 64)))
+
+        first.delete()
+        self.assertFalse(storage.release(name))
+        self.assertTrue(picture_storage.exists(name))
+        second.delete()
+        # Just touched by the second upload, whose row might not be saved yet
+        self.assertFalse(storage.release(name))
+        self.assertTrue(picture_storage.exists(name))
+        with self.settings(RANGO_PROFILE_IMAGE_RELEASE_GRACE=0):
+            self.assertTrue(storage.release(name))
+        self.assertFalse(picture_storage.exists(name))
+        self.assertFalse(picture_storage.exists(thumbnails.variant_name(name, 64)))
+
+    def test_dedupe_command_moves_old_names(self):
+        from django.contrib.auth.models import User
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import FileSystemStorage
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        from rango import storage
+        from rango.models import UserProfile
+        legacy = FileSystemStorage()
+        old_name = legacy.save('profile_images/CameronIcon.png', ContentFile(b'legacy'))
+        for username in ('a', 'b'):
+            UserProfile.objects.create(user=User.objects.create_user(username), picture=old_name)
+        call_command('dedupe_profile_images', stdout=StringIO())
+        names = set(UserProfile.objects.values_list('picture', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(storage.is_content_addressed(names.pop()))
+        self.assertFalse(legacy.exists(old_name))
+
+    def test_hashed_pictures_are_served_as_immutable(self):
+        from django.test import RequestFactory
+        from rango.views import serve_profile_image
+        name = self.make_profile('first', b'cached').picture.name
+        response = serve_profile_image(RequestFactory().get('/media/' + name), name)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_thumbnails_are_not_served_as_immutable(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from django.test import RequestFactory
+        from rango import storage, thumbnails
+        from rango.views import serve_profile_image
+        profile = self.make_profile('first', b'cached')
+        thumb = thumbnails.variant_name(profile.picture.name, 64)
+        default_storage.save(thumb, ContentFile(b'thumb'))
+        self.assertFalse(storage.is_content_addressed(thumb))
+        response = serve_profile_image(RequestFactory().get('/media/' + thumb), thumb)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+
+class VisitTrackingTests(TestCase):
+
+    def test_visits_are_counted_once_per_day(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rango import visits
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['visits'], 1)
+        self.assertIn(visits.COOKIE, response.cookies)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['visits'], 1)
+        # Nothing changed: no cookie and no session write
+        self.assertNotIn(visits.COOKIE, response.cookies)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse([q for q in queries.captured_queries if 'django_session' in q['sql']])
+
+    def test_new_day_increments(self):
+        import datetime
+        from rango import visits
+        earlier = datetime.date.today() - datetime.timedelta(days=2)
+        self.client.cookies[visits.COOKIE] = self.signed('4:{0}'.format(earlier.isoformat()))
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['visits'], 5)
+        self.assertIn(visits.COOKIE, response.cookies)
+
+    def test_tampered_cookie_starts_over(self):
+        from rango import visits
+        self.client.cookies[visits.COOKIE] = '99:2000-01-01'
+        self.assertEqual(self.client.get(reverse('index')).context['visits'], 1)
+
+    def signed(self, value):
+        from django.core import signing
+        from rango import visits
+        return signing.get_cookie_signer(salt=visits.COOKIE + visits.SALT).sign(value)
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        from rango import metrics
+        metrics.reset()
+
+    def test_histogram_buckets_are_cumulative(self):
+        from rango.metrics import Histogram
+        histogram = Histogram('test_seconds', 'Test.', (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe('index', value)
+        cumulative, count, total = histogram.snapshot('index')
+        self.assertEqual(cumulative, [2, 3, 4])
+        self.assertEqual(count, 4)
+        self.assertAlmostEqual(total, 3.65)
+
+    def test_requests_are_recorded_per_url_name(self):
+        from rango import metrics
+        from rango.models import Category
+        Category.objects.create(name='Python')
+        self.client.get(reverse('index'))
+        self.client.get(reverse('show_category', args=['python']))
+        self.client.get(reverse('show_category', args=['python']))
+
+        self.assertEqual(metrics.duration.snapshot('show_category')[1], 2)
+        self.assertEqual(metrics.duration.snapshot('index')[1], 1)
+        cumulative, count, total = metrics.queries.snapshot('show_category')
+        self.assertGreater(total, 0)
+        self.assertGreater(metrics.template_duration.snapshot('index')[2], 0)
+        # Nested renders are only counted once, so this stays within the wall time
+        self.assertLessEqual(metrics.template_duration.snapshot('index')[2],
+                             metrics.duration.snapshot('index')[2])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode('utf-8')
+        self.assertIn('# TYPE rango_view_duration_seconds histogram', body)
+        self.assertIn('rango_view_db_queries_bucket{view="index",le="+Inf"} 1', body)
+
+        forbidden = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(forbidden.status_code, 403)
+
+
+class CategoryPageListCacheTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango.models import Category, Page
+        cache.clear()
+        self.category = Category.objects.create(name='Cached')
+        self.other = Category.objects.create(name='Other')
+        Page.objects.create(category=self.category, title='First', url='http://example.com/1')
+
+    def get(self):
+        return self.client.get(reverse('show_category', args=['cached']))
+
+    def test_page_list_is_rendered_once_per_version(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.get()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get()
+        self.assertIn(b'First', response.content)
+        self.assertFalse([q for q in queries.captured_queries if 'rango_page' in q['sql']])
+
+    def test_page_changes_invalidate_only_their_category(self):
+        from rango.caching import category_namespace, get_version
+        from rango.models import Page
+        other_version = get_version(category_namespace(self.other.pk))
+        self.get()
+        page = Page.objects.create(category=self.category, title='Second', url='http://example.com/2')
+        self.assertIn(b'Second', self.get().content)
+        page.delete()
+        self.assertNotIn(b'Second', self.get().content)
+        self.assertEqual(get_version(category_namespace(self.other.pk)), other_version)
+
+    def test_flushed_views_reorder_the_list(self):
+        from rango import counters
+        from rango.models import Page
+        Page.objects.create(category=self.category, title='Second', url='http://example.com/2')
+        content = self.get().content
+        self.assertLess(content.index(b'Second'), content.index(b'First'))
+        buffer = counters.CounterBuffer(interval=0, threshold=0)
+        buffer.incr(Page, Page.objects.get(title='First').pk, 'views', 3)
+        buffer.flush()
+        content = self.get().content
+        self.assertLess(content.index(b'First'), content.index(b'Second'))
+
+    def test_made_up_cursors_share_the_first_page_entry(self):
+        from django.core.cache import cache
+        from rango.pagination import encode_cursor
+        self.get()
+        entries = len(cache._cache)
+        for cursor in ('garbage', 'more-garbage', encode_cursor([1, 2, 3])):
+            response = self.client.get(reverse('show_category', args=['cached']), {'cursor': cursor})
+            self.assertIn(b'First', response.content)
+        self.assertEqual(len(cache._cache), entries)
+        self.client.get(reverse('show_category', args=['cached']), {'cursor': encode_cursor([5, 1])})
+        self.assertGreater(len(cache._cache), entries)
+
+
+class ConditionalResponseTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango.models import Category, Page
+        cache.clear()
+        self.category = Category.objects.create(name='Python')
+        Page.objects.create(category=self.category, title='Docs', url='http://docs.python.org/')
+
+    def test_category_etag_and_last_modified(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('show_category', args=['python'])
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertIn('Cookie', response['Vary'])
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        # Only the slug lookup behind the validator ran
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_changes_and_login_change_the_etag(self):
+        from django.contrib.auth.models import User
+        from rango.models import Page
+        url = reverse('show_category', args=['python'])
+        etag = self.client.get(url)['ETag']
+        Page.objects.create(category=self.category, title='Tutorial', url='http://docs.python.org/tutorial/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Tutorial', response.content)
+
+        User.objects.create_user('reader', password='secret')
+        self.client.login(username='reader', password='secret')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=0, must-revalidate')
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_index_etag_follows_the_leaderboards(self):
+        from rango import leaderboards
+        from rango.models import Page
+        response = self.client.get(reverse('index'))
+        # Send the visits cookie back, as a browser would
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        etag = self.client.get(reverse('index'))['ETag']
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        page = Page.objects.get(title='Docs')
+        leaderboards.pages.record_increment(page.pk, 10)
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BatchAddPagesTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from rango.models import Category, Page
+        cache.clear()
+        self.category = Category.objects.create(name='Python')
+        Page.objects.create(category=self.category, title='Docs', url='http://docs.python.org/')
+        User.objects.create_user('adder', password='secret')
+        self.client.login(username='adder', password='secret')
+
+    def test_adds_new_pairs_in_one_insert(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rango import local_search
+        from rango.models import Page
+        data = {'category_id': self.category.id,
+                'title': ['Docs', 'Tutorial', 'Tutorial', 'PyPI'],
+                'url': ['http://docs.python.org/', 'http://docs.python.org/tutorial/',
+                        'http://docs.python.org/tutorial/', 'https://pypi.org/']}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('auto_add_pages'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Page.objects.filter(category=self.category).count(), 3)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "rango_page"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertLess(len(queries.captured_queries), 15)
+        # One fragment with the category's up to date page list
+        for title in (b'Docs', b'Tutorial', b'PyPI'):
+            self.assertIn(title, response.content)
+        if local_search.is_available():
+            self.assertEqual([r['title'] for r in local_search.search('pypi')], ['PyPI'])
+
+    def test_rejects_bad_requests(self):
+        url = reverse('auto_add_pages')
+        self.assertEqual(self.client.get(url, {'category_id': self.category.id}).status_code, 405)
+        response = self.client.post(url, {'category_id': self.category.id, 'title': ['A', 'B'], 'url': ['http://a/']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_inserts_go_through_the_writer(self):
+        from unittest import mock
+        from rango import write_queue
+        from rango.models import Page
+        with mock.patch('rango.write_queue.run', side_effect=write_queue.run) as run:
+            self.client.post(reverse('auto_add_pages'), {'category_id': self.category.id,
+                                                         'title': ['PyPI'], 'url': ['https://pypi.org/']})
+            self.client.get(reverse('auto_add_page'), {'category_id': self.category.id,
+                                                       'title': 'Wiki', 'url': 'https://wiki.python.org/'})
+        self.assertEqual(run.call_count, 2)
+        self.assertEqual(Page.objects.filter(category=self.category).count(), 3)
+
+    def test_rejects_invalid_pairs(self):
+        from rango.models import Page
+        url = reverse('auto_add_pages')
+        for title, page_url in (('Evil', 'javascript:alert(1)'), ('x' * 129, 'http://example.com/'),
+                                ('Long', 'http://example.com/' + 'a' * 200), ('', 'http://example.com/')):
+            response = self.client.post(url, {'category_id': self.category.id,
+                                              'title': ['Fine', title], 'url': ['http://fine.com/', page_url]})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Page.objects.filter(category=self.category).count(), 1)
+        # Scheme-less URLs are fixed up like in the add_page form
+        self.client.post(url, {'category_id': self.category.id, 'title': ['Fine'], 'url': ['fine.com/']})
+        self.assertTrue(Page.objects.filter(category=self.category, url='http://fine.com/').exists())
+
+
+class CanonicalUrlTests(TestCase):
+
+    def test_variants_share_a_hash(self):
+        from rango.canonical_urls import normalize_url, url_hash
+        variants = ['http://Docs.Python.org/3/tutorial/',
+                    'https://docs.python.org/3/tutorial',
+                    'docs.python.org:80/3/tutorial/#intro',
+                    'http://docs.python.org/3/%74utorial?utm_source=feed&fbclid=x']
+        self.assertEqual(set(normalize_url(url) for url in variants), {'http://docs.python.org/3/tutorial'})
+        self.assertEqual(len(set(url_hash(url) for url in variants)), 1)
+        self.assertEqual(normalize_url('http://example.com?b=2&a=1'), 'http://example.com/?a=1&b=2')
+        self.assertNotEqual(url_hash('http://example.com/a'), url_hash('http://example.com/b'))
+        self.assertEqual(len(url_hash('http://example.com/')), 40)
+
+    def test_unparseable_hosts_and_ports(self):
+        from rango.canonical_urls import normalize_url, url_hash
+        from rango.forms import PageForm
+        from rango.models import Category, Page
+        self.assertEqual(normalize_url(' http://example.com:99999/ '), 'http://example.com:99999/')
+        self.assertEqual(len(url_hash('http://[::1/')), 40)
+        self.assertEqual(normalize_url('http://[::1]:8080/a/'), 'http://[::1]:8080/a')
+        self.assertEqual(normalize_url('https://[2001:db8::1]:443'), 'http://[2001:db8::1]/')
+
+        category = Category.objects.create(name='Ports')
+        form = PageForm({'title': 'Bad port', 'url': 'http://example.com:99999/', 'views': 0}, category=category)
+        self.assertFalse(form.is_valid())
+        self.assertIn('url', form.errors)
+        page = Page.objects.create(category=category, title='Bad port', url='http://example.com:99999/')
+        self.assertEqual(page.url_hash, url_hash('http://example.com:99999/'))
+
+    def test_duplicates_are_found_by_hash(self):
+        from django.contrib.auth.models import User
+        from rango.forms import PageForm
+        from rango.importer import import_rows
+        from rango.models import Category, Page
+        category = Category.objects.create(name='Python')
+        page = Page.objects.create(category=category, title='Tutorial', url='https://docs.python.org/3/tutorial/')
+        self.assertEqual(page.url_hash, Page.objects.get(pk=page.pk).url_hash)
+
+        form = PageForm({'title': 'Again', 'url': 'docs.python.org/3/tutorial', 'views': 0}, category=category)
+        self.assertFalse(form.is_valid())
+        self.assertIn('url', form.errors)
+        form = PageForm({'title': 'Secure', 'url': 'https://www.python.org/', 'views': 0}, category=category)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['url'], 'https://www.python.org/')
+
+        import_rows([{'category': 'Python', 'title': 'Tutorial', 'url': 'http://docs.python.org/3/tutorial?utm_medium=x',
+                      'views': 5}])
+        self.assertEqual(Page.objects.count(), 1)
+        self.assertEqual(Page.objects.get().views, 5)
+
+        User.objects.create_user('adder', password='secret')
+        self.client.login(username='adder', password='secret')
+        self.client.get(reverse('auto_add_page'), {'category_id': category.id, 'title': 'Dup',
+                                                   'url': 'HTTP://DOCS.PYTHON.ORG/3/tutorial/'})
+        self.assertEqual(Page.objects.count(), 1)
+
+
+class LinkCheckerTests(TestCase):
+
+    def setUp(self):
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+        self.requests = requests = []
+        self.in_flight = in_flight = {'now': 0, 'max': 0}
+        lock = threading.Lock()
+
+        class StandIn(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def respond(self, send_body):
+                requests.append((self.command, self.path))
+                with lock:
+                    in_flight['now'] += 1
+                    in_flight['max'] = max(in_flight['max'], in_flight['now'])
+                try:
+                    if self.path.startswith('/slow'):
+                        time.sleep(0.1 if self.path == '/slow' else 1)
+                    if self.path == '/moved':
+                        self.send_response(301)
+                        self.send_header('Location', '/ok')
+                    elif self.path == '/nohead' and not send_body:
+                        self.send_response(405)
+                    elif self.path in ('/ok', '/nohead', '/slow'):
+                        self.send_response(200)
+                    else:
+                        self.send_response(404)
+                    self.send_header('Content-Length', '2' if send_body else '0')
+                    self.end_headers()
+                    if send_body:
+                        self.wfile.write(b'ok')
+                finally:
+                    with lock:
+                        in_flight['now'] -= 1
+
+            def do_HEAD(self):
+                self.respond(False)
+
+            def do_GET(self):
+                self.respond(True)
+
+            def log_message(self, *args):
+                pass
+
+        class ThreadingServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = ThreadingServer(('127.0.0.1', 0), StandIn)
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_pages(self, *paths):
+        from rango.models import Category, Page
+        category, created = Category.objects.get_or_create(name='Links')
+        return [Page.objects.create(category=category, title=path, url=self.base + path) for path in paths]
+
+    def test_results_are_stored(self):
+        from rango.link_checker import LinkChecker, pages_to_check
+        from rango.models import LinkCheck, Page
+        pages = self.add_pages('/ok', '/moved', '/nohead', '/missing', '/slow-hang')
+        pages.append(Page.objects.create(category=pages[0].category, title='closed',
+                                         url='http://127.0.0.1:1/closed'))
+        checker = LinkChecker(concurrency=10, per_host=10, timeout=0.5)
+        self.assertEqual(checker.run(pages_to_check()), 6)
+        checks = dict((check.page.title, check) for check in LinkCheck.objects.select_related('page'))
+
+        self.assertEqual(checks['/ok'].status, 200)
+        self.assertEqual(checks['/moved'].status, 200)
+        self.assertEqual(checks['/moved'].final_url, self.base + '/ok')
+        self.assertEqual(checks['/nohead'].status, 200)
+        self.assertIn(('GET', '/nohead'), self.requests)
+        self.assertNotIn(('GET', '/ok'), self.requests)
+        self.assertEqual(checks['/missing'].status, 404)
+        self.assertIsNone(checks['/slow-hang'].status)
+        self.assertEqual(checks['/slow-hang'].error, 'timed out')
+        self.assertFalse(checks['closed'].is_healthy)
+        self.assertTrue(checks['closed'].error)
+        self.assertEqual(checker.healthy, 3)
+
+    def test_per_host_limit_and_recheck_window(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from django.utils.six import StringIO
+        from rango.link_checker import pages_to_check
+        self.add_pages(*['/slow'] * 6)
+        out = StringIO()
+        call_command('check_links', concurrency=10, per_host=2, timeout=5, stdout=out)
+        self.assertIn('Checked 6 pages: 6 healthy', out.getvalue())
+        self.assertEqual(self.in_flight['max'], 2)
+        self.assertEqual(list(pages_to_check(timezone.now() - timedelta(hours=1))), [])
+
+
+    def test_host_limits_are_dropped_when_their_tasks_finish(self):
+        import asyncio
+        from unittest import mock
+        from rango import link_checker
+        from rango.models import Category, Page
+        category = Category.objects.create(name='Hosts')
+        pages = [Page.objects.create(category=category, title=str(i), url='http://host{0}.invalid/'.format(i))
+                 for i in range(50)]
+        checker = link_checker.LinkChecker(concurrency=2, per_host=1, timeout=1)
+        tracked = []
+
+        async def check_url(url, timeout):
+            tracked.append(len(checker._hosts))
+            await asyncio.sleep(0)
+            return link_checker.Result(200, url, 0.0, '')
+
+        with mock.patch('rango.link_checker.check_url', check_url):
+            self.assertEqual(checker.run((page.pk, page.url) for page in pages), 50)
+        # Only the hosts of scheduled tasks, at most concurrency * 4
+        self.assertLessEqual(max(tracked), 8)
+        self.assertEqual(checker._hosts, {})
+
+class ClickRollupTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.docs = Page.objects.create(category=self.python, title='Docs', url='http://docs.python.org/')
+        self.pypi = Page.objects.create(category=self.python, title='PyPI', url='https://pypi.org/')
+        self.tutorial = Page.objects.create(category=self.django, title='Tutorial',
+                                            url='https://docs.djangoproject.com/')
+
+    def test_clicks_are_buffered_and_written_in_batches(self):
+        from rango.clicks import ClickBuffer
+        from rango.models import ClickEvent
+        buffer = ClickBuffer(interval=0, threshold=3)
+        buffer.record(self.docs.pk, self.python.pk)
+        buffer.record(self.docs.pk, self.python.pk)
+        self.assertEqual(ClickEvent.objects.count(), 0)
+        buffer.record(self.pypi.pk, self.python.pk)
+        self.assertEqual(ClickEvent.objects.count(), 3)
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_rollup_and_trending(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from rango import clicks
+        from rango.models import CategoryClicks, ClickEvent, PageClicks
+        now = timezone.now()
+        buffer = clicks.ClickBuffer(interval=0, threshold=0)
+        for page, hours_ago, count in ((self.docs, 0, 3), (self.pypi, 0, 1), (self.tutorial, 30, 5)):
+            for _ in range(count):
+                buffer.record(page.pk, page.category_id, now - timedelta(hours=hours_ago))
+        buffer.flush()
+
+        self.assertEqual(clicks.rollup(), 9)
+        self.assertEqual(ClickEvent.objects.count(), 0)
+        # A second rollup adds to the existing buckets
+        buffer.record(self.pypi.pk, self.python.pk, now)
+        buffer.record(self.pypi.pk, self.python.pk, now)
+        buffer.record(self.pypi.pk, self.python.pk, now)
+        buffer.flush()
+        self.assertEqual(clicks.rollup(), 3)
+        self.assertEqual(PageClicks.objects.get(period=PageClicks.HOUR, page=self.pypi).clicks, 4)
+        self.assertEqual(CategoryClicks.objects.filter(period=PageClicks.DAY, category=self.python)
+                         .order_by('-start').first().clicks, 7)
+
+        trending = clicks.trending_pages(hours=24)
+        self.assertEqual([(page.title, page.recent_clicks) for page in trending], [('PyPI', 4), ('Docs', 3)])
+        self.assertEqual(clicks.trending_pages(hours=48)[0].title, 'Tutorial')
+        self.assertEqual([c.name for c in clicks.trending_categories(hours=48)], ['Python', 'Django'])
+        # Longer than the hourly retention: answered from the daily buckets
+        self.assertEqual(sum(p.recent_clicks for p in clicks.trending_pages(hours=24 * 30)), 12)
+
+    def test_track_url_logs_the_click(self):
+        from rango import clicks, hotness
+        before = clicks.get_buffer().pending()
+        self.client.get(reverse('goto'), {'page_id': self.docs.pk})
+        self.assertEqual(clicks.get_buffer().pending(), before + 1)
+        # Written inside the test transaction, not at exit
+        self.assertEqual(clicks.flush(), before + 1)
+        hotness.flush()
+
+
+class HotScoreTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        self.flask = Category.objects.create(name='Flask')
+        self.docs = Page.objects.create(category=self.flask, title='Docs', url='http://flask.pocoo.org/')
+
+    def tearDown(self):
+        from rango import clicks, counters, hotness
+        counters.flush()
+        clicks.flush()
+        hotness.flush()
+
+    def test_recent_likes_outrank_older_ones(self):
+        from datetime import timedelta
+        from django.test import override_settings
+        from django.utils import timezone
+        from rango import hotness
+        now = timezone.now()
+        buffer = hotness.HotScoreBuffer(interval=0)
+        with override_settings(RANGO_HOT_HALF_LIFE_HOURS=24):
+            # Three likes two days ago are worth 3/4 of a like now
+            for _ in range(3):
+                buffer.record(self.python.pk, hotness.LIKE, now - timedelta(days=2))
+            buffer.record(self.django.pk, hotness.LIKE, now)
+            self.assertEqual([c.name for c in hotness.hot_categories()], ['Django', 'Python'])
+            self.python.refresh_from_db()
+            self.assertAlmostEqual(hotness.current_score(self.python.hot, now), 0.75)
+            # Added in the database, on top of what is stored
+            buffer.record(self.python.pk, hotness.LIKE, now)
+            self.python.refresh_from_db()
+            self.assertAlmostEqual(hotness.current_score(self.python.hot, now), 1.75)
+            self.assertEqual(hotness.hot_categories()[0], self.python)
+
+    def test_buffered_events_are_summed_per_category(self):
+        from django.utils import timezone
+        from rango import hotness
+        now = timezone.now()
+        buffer = hotness.HotScoreBuffer(interval=60)
+        for _ in range(5):
+            buffer.record(self.flask.pk, hotness.CLICK, now)
+        self.assertAlmostEqual(hotness.current_score(buffer.pending(self.flask.pk), now), 1.0)
+        self.assertEqual(buffer.flush(), 1)
+        self.flask.refresh_from_db()
+        self.assertAlmostEqual(hotness.current_score(self.flask.hot, now), 1.0)
+
+    def test_like_and_click_record_events(self):
+        from django.contrib.auth.models import User
+        from rango import hotness
+        User.objects.create_user('liker', password='secret')
+        self.client.login(username='liker', password='secret')
+        self.client.get(reverse('like_category'), {'category_id': self.python.pk})
+        self.client.get(reverse('goto'), {'page_id': self.docs.pk})
+        self.assertEqual(hotness.flush(), 2)
+        self.assertEqual([c.name for c in hotness.hot_categories()], ['Python', 'Flask'])
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Hot Categories')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # Two SQLite files stand in for replicas: copies of the test database
+    # taken in setUp, which miss everything written after that. Not a
+    # TestCase: inside its transaction every read goes to the primary.
+    replicas = ['replica1', 'replica2']
+
+    def setUp(self):
+        import os
+        import sqlite3
+        import tempfile
+        from django.contrib.auth.models import User
+        from django.db import connection, connections
+        from rango import db_router, local_search
+        from rango.models import Category
+        User.objects.create_user('writer', password='secret')
+        self.python = Category.objects.create(name='Python')
+        connection.ensure_connection()
+        # The full-text index's shadow tables do not survive a dump, and are not needed
+        dump = '\n'.join(statement for statement in connection.connection.iterdump()
+                          if local_search.TABLE not in statement)
+        self.directory = tempfile.mkdtemp()
+        for alias in self.replicas:
+            name = os.path.join(self.directory, alias + '.sqlite3')
+            replica = sqlite3.connect(name)
+            replica.executescript(dump)
+            replica.close()
+            connections.databases[alias] = {'ENGINE': 'rango.backends.sqlite3', 'NAME': name}
+        # Not copied yet
+        Category.objects.create(name='Fresh')
+        db_router.reset()
+
+    def tearDown(self):
+        import shutil
+        from django.db import connections
+        from rango import counters, db_router, hotness
+        counters.flush()
+        hotness.flush()
+        for alias in self.replicas:
+            connections[alias].close()
+            del connections.databases[alias]
+            if hasattr(connections._connections, alias):
+                delattr(connections._connections, alias)
+        shutil.rmtree(self.directory)
+        db_router.reset()
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        from django.db import router
+        from django.test import override_settings
+        from rango.models import Category
+        with override_settings(RANGO_DB_REPLICAS=self.replicas):
+            self.assertIn(router.db_for_read(Category), self.replicas)
+            self.assertTrue(Category.objects.filter(name='Python').exists())
+            self.assertFalse(Category.objects.filter(name='Fresh').exists())
+            created = Category.objects.create(name='Brand New')
+            self.assertEqual(created._state.db, 'default')
+            # The rest of this thread's work reads its own writes
+            self.assertEqual(router.db_for_read(Category), 'default')
+            self.assertTrue(Category.objects.filter(name='Fresh').exists())
+        self.assertEqual(router.db_for_read(Category), 'default')
+
+    def test_reads_in_a_transaction_go_to_primary(self):
+        from django.db import router, transaction
+        from django.test import override_settings
+        from rango.models import Category
+        with override_settings(RANGO_DB_REPLICAS=self.replicas):
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Category), 'default')
+                self.assertTrue(Category.objects.filter(name='Fresh').exists())
+            self.assertIn(router.db_for_read(Category), self.replicas)
+
+    def test_one_replica_per_request(self):
+        from django.db import router
+        from django.test import override_settings
+        from rango import db_router
+        from rango.models import Category
+        with override_settings(RANGO_DB_REPLICAS=self.replicas):
+            chosen = set()
+            for _ in range(20):
+                db_router.reset()
+                first = router.db_for_read(Category)
+                self.assertEqual(set(router.db_for_read(Category) for _ in range(10)), {first})
+                chosen.add(first)
+            self.assertEqual(chosen, set(self.replicas))
+
+    def test_client_that_wrote_reads_from_primary(self):
+        from django.test import override_settings
+        from rango import db_router
+        self.client.login(username='writer', password='secret')
+        db_router.reset()
+        with override_settings(RANGO_DB_REPLICAS=self.replicas):
+            response = self.client.get(reverse('show_category', args=['fresh']))
+            self.assertIsNone(response.context['category'])
+            self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+            response = self.client.get(reverse('like_category'), {'category_id': self.python.pk})
+            self.assertIn(db_router.PIN_COOKIE, response.cookies)
+            response = self.client.get(reverse('show_category', args=['fresh']))
+            self.assertEqual(response.context['category'].name, 'Fresh')
+
+            # Once the window has passed, reads go back to the replicas
+            self.client.cookies[db_router.PIN_COOKIE] = '0'
+            response = self.client.get(reverse('show_category', args=['fresh']))
+            self.assertIsNone(response.context['category'])
+
+
+class SQLiteWriteQueueTests(TestCase):
+    # A scratch SQLite file: the writer thread needs a database the test
+    # transaction does not hold locked.
+    alias = 'write_queue_test'
+
+    def setUp(self):
+        import os
+        import tempfile
+        from django.db import connections
+        self.directory = tempfile.mkdtemp()
+        connections.databases[self.alias] = {
+            'ENGINE': 'rango.backends.sqlite3', 'NAME': os.path.join(self.directory, 'db.sqlite3'),
+            'PRAGMAS': {'journal_mode': 'wal', 'synchronous': 'normal', 'busy_timeout': 1234}}
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (name TEXT PRIMARY KEY, value INTEGER)')
+
+    def tearDown(self):
+        import shutil
+        from django.db import connections
+        connections[self.alias].close()
+        del connections.databases[self.alias]
+        if hasattr(connections._connections, self.alias):
+            delattr(connections._connections, self.alias)
+        shutil.rmtree(self.directory)
+
+    def insert(self, name, value):
+        from django.db import connections
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('INSERT INTO counter VALUES (%s, %s)', [name, value])
+        return value
+
+    def test_pragmas_are_applied(self):
+        from django.db import connections
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_waiting_jobs_share_a_transaction(self):
+        import threading
+        from django.db import connections
+        from rango.write_queue import WriteQueue
+        write_queue = WriteQueue(using=self.alias)
+        started, release = threading.Event(), threading.Event()
+        first = write_queue.submit(lambda: started.set() or release.wait(5) and self.insert('first', 1))
+        started.wait(5)
+        waiting = [write_queue.submit(lambda i=i: self.insert('job {0}'.format(i), i)) for i in range(3)]
+        failing = write_queue.submit(lambda: self.insert('first', 2))
+        release.set()
+        self.assertEqual(first.result(), 1)
+        self.assertEqual([future.result() for future in waiting], [0, 1, 2])
+        # Its savepoint was rolled back; the rest of the batch committed
+        with self.assertRaises(Exception):
+            failing.result()
+        write_queue.close()
+        self.assertEqual(write_queue.batches, 2)
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM counter')
+            self.assertEqual(cursor.fetchone()[0], 4)
+
+    def test_runs_inline_in_an_atomic_block(self):
+        import threading
+        from django.db import transaction
+        from rango.write_queue import WriteQueue
+        write_queue = WriteQueue(using=self.alias)
+        with transaction.atomic(using=self.alias):
+            self.assertEqual(write_queue.run(threading.current_thread), threading.current_thread())
+        self.assertEqual(write_queue.batches, 0)
+
+
+class PasswordThrottleTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from rango import metrics
+        cache.clear()
+        metrics.reset()
+        User.objects.create_user('victim', password='correct horse')
+
+    def hashes(self):
+        from rango import metrics
+        return sum(metrics.password_hash_duration.snapshot(label)[1]
+                   for label in metrics.password_hash_duration.labels())
+
+    def login(self, username, address='127.0.0.1'):
+        from django.test import RequestFactory
+        from rango.views import user_login
+        # Through the view directly: the registration app's login template
+        # does not render on this Django version
+        request = RequestFactory().post('/login/', {'username': username, 'password': 'guess'},
+                                        REMOTE_ADDR=address)
+        return user_login(request)
+
+    def test_login_is_throttled_per_username_before_hashing(self):
+        from django.test import override_settings
+        with override_settings(RANGO_PASSWORD_THROTTLE={'username': (2, 60), 'ip': (100, 1)}):
+            for _ in range(2):
+                self.assertContains(self.login('victim'), 'Invalid Login Details')
+            hashes = self.hashes()
+            self.assertGreater(hashes, 0)
+            response = self.login('Victim')
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+            self.assertEqual(self.hashes(), hashes)
+            # Other accounts are not locked out
+            self.assertEqual(self.login('other').status_code, 200)
+
+    def test_throttled_per_ip(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory, override_settings
+        from rango.throttle import throttled
+        view = throttled('register')(lambda request: HttpResponse('registered'))
+        factory = RequestFactory()
+        with override_settings(RANGO_PASSWORD_THROTTLE={'username': (100, 1), 'ip': (1, 60)}):
+            self.assertEqual(view(factory.post('/', {'username': 'new'}, REMOTE_ADDR='10.0.0.1')).status_code, 200)
+            self.assertEqual(view(factory.post('/', {'username': 'newer'}, REMOTE_ADDR='10.0.0.1')).status_code, 429)
+            self.assertEqual(view(factory.post('/', {'username': 'newer'}, REMOTE_ADDR='10.0.0.2')).status_code, 200)
+            # Showing the form is free
+            self.assertEqual(view(factory.get('/', REMOTE_ADDR='10.0.0.1')).status_code, 200)
+
+    def test_buckets_refill(self):
+        from django.test import override_settings
+        from rango import throttle
+        with override_settings(RANGO_PASSWORD_THROTTLE={'username': (2, 10)}):
+            subjects = [('username', 'victim')]
+            self.assertEqual(throttle.take('login', subjects, now=1000), 0)
+            self.assertEqual(throttle.take('login', subjects, now=1000), 0)
+            self.assertAlmostEqual(throttle.take('login', subjects, now=1004), 6)
+            self.assertEqual(throttle.take('login', subjects, now=1010), 0)
+
+    def test_hashing_pool_is_bounded(self):
+        import threading
+        from rango import metrics
+        from rango.hashers import HashingPool, PasswordHashingBusy
+        pool = HashingPool(workers=1, queue=0)
+        started, release = threading.Event(), threading.Event()
+        worker = threading.Thread(target=pool.run, args=('test', lambda: started.set() or release.wait(5)))
+        worker.start()
+        started.wait(5)
+        with self.assertRaises(PasswordHashingBusy):
+            pool.run('test', lambda: None)
+        release.set()
+        worker.join()
+        self.assertEqual(pool.run('test', lambda: 42), 42)
+        self.assertEqual(metrics.password_hash_duration.snapshot('test')[1], 2)
+        self.assertIn('rango_password_hash_seconds_count{algorithm="test"} 2', metrics.exposition())
+
+    def test_full_hashing_pool_is_a_503_on_unthrottled_views(self):
+        from unittest import mock
+        from rango.hashers import PasswordHashingBusy, get_pool
+        with mock.patch.object(get_pool(), 'run', side_effect=PasswordHashingBusy):
+            response = self.client.post('/admin/login/', {'username': 'victim', 'password': 'guess'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
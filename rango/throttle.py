@@ -0,0 +1,105 @@
+"""
+Token-bucket throttling of the views that hash passwords.
+
+Every PBKDF2 hash is deliberately expensive, so a burst of login or
+registration attempts can keep every worker's CPU busy. The views wrapped
+with throttled() take a token from a bucket per client IP and, when a
+username is posted, one per username, before any hashing happens; a
+request finding either bucket empty gets a 429 with Retry-After instead.
+
+RANGO_PASSWORD_THROTTLE gives each bucket as (burst, seconds per token):
+'username': (5, 60) allows five attempts at once, then one a minute.
+The buckets live in the cache, so the limits hold across every worker
+that shares it (settings.CACHES is a file cache shared by the workers of
+one host). Two requests racing on one bucket may both get its last token;
+the limit is approximate, not exact.
+
+PasswordHashingBusyMiddleware answers a full hashing pool (rango/hashers.py)
+with a 503 wherever the hash was asked for, throttled view or not, e.g.
+the admin login or a password change.
+"""
+import hashlib
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from rango.hashers import PasswordHashingBusy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = {'username': (5, 60), 'ip': (20, 6)}
+
+
+def _buckets():
+    return getattr(settings, 'RANGO_PASSWORD_THROTTLE', DEFAULT_BUCKETS)
+
+
+def _key(scope, kind, value):
+    digest = hashlib.sha1(value.lower().encode('utf-8')).hexdigest()
+    return 'rango:throttle:{0}:{1}:{2}'.format(scope, kind, digest)
+
+
+def _refill(state, burst, seconds_per_token, now):
+    tokens, updated = state if state is not None else (burst, now)
+    return min(burst, tokens + (now - updated) / seconds_per_token)
+
+
+def take(scope, subjects, now=None):
+    """
+    Takes a token from every (kind, value) bucket in subjects, or from none
+    of them. Returns 0 on success, else the seconds until all have one.
+    """
+    now = time.time() if now is None else now
+    buckets = _buckets()
+    keys = {_key(scope, kind, value): buckets[kind] for kind, value in subjects if value}
+    states = cache.get_many(list(keys))
+    refilled = {key: _refill(states.get(key), burst, per_token, now)
+                for key, (burst, per_token) in keys.items()}
+    wait = max([(1 - tokens) * keys[key][1] for key, tokens in refilled.items() if tokens < 1] or [0])
+    if wait:
+        return wait
+    for key, tokens in refilled.items():
+        burst, per_token = keys[key]
+        # Expires once it would be full again anyway
+        cache.set(key, (tokens - 1, now), int(math.ceil(burst * per_token)) + 1)
+    return 0
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def throttled(scope):
+    """
+    Rejects POSTs to the view when the client's or the posted username's
+    bucket is empty.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                wait = take(scope, [('ip', client_ip(request)), ('username', request.POST.get('username'))])
+                if wait:
+                    logger.info('Throttled %s attempt from %s', scope, client_ip(request))
+                    response = HttpResponse('Too many attempts, please try again later.', status=429)
+                    response['Retry-After'] = int(math.ceil(wait))
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PasswordHashingBusyMiddleware(MiddlewareMixin):
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, PasswordHashingBusy):
+            response = HttpResponse('The server is busy, please try again shortly.', status=503)
+            response['Retry-After'] = 1
+            return response
+        return None
@@ -0,0 +1,121 @@
+"""
+Thumbnails and optimised variants of UserProfile pictures.
+
+After a profile picture is saved, square thumbnails for each size in
+RANGO_THUMBNAIL_SIZES and an optimised copy (at most
+RANGO_THUMBNAIL_OPTIMIZED_MAX pixels on its longest side, re-encoded) are
+written next to it under thumbs/. The work is queued on a small thread pool
+once the saving transaction commits, so uploads never wait for it. Pages ask
+for the best variant for the size they display with best_variant_url() (or
+the profile_picture_url template tag); until a variant exists they get the
+original.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZED = 'opt'
+
+_executor = None
+
+
+def sizes():
+    return sorted(getattr(settings, 'RANGO_THUMBNAIL_SIZES', (64, 128, 256)))
+
+
+def variant_name(name, variant):
+    """profile_images/cat.png -> profile_images/thumbs/cat_64.png"""
+    directory, filename = os.path.split(name)
+    stem, ext = os.path.splitext(filename)
+    if ext.lower() not in ('.png', '.gif'):
+        ext = '.jpg'
+    return os.path.join(directory, 'thumbs', '{0}_{1}{2}'.format(stem, variant, ext.lower()))
+
+
+def variant_names(name):
+    return [variant_name(name, size) for size in sizes()] + [variant_name(name, OPTIMIZED)]
+
+
+def best_variant(name, size):
+    """
+    Returns the storage name of the smallest variant at least size pixels
+    wide, falling back to the optimised copy and then the original.
+    """
+    candidates = [variant_name(name, s) for s in sizes() if s >= size]
+    candidates.append(variant_name(name, OPTIMIZED))
+    for candidate in candidates:
+        if default_storage.exists(candidate):
+            return candidate
+    return name
+
+
+def best_variant_url(name, size):
+    return default_storage.url(best_variant(name, size))
+
+
+def _encode(image, name):
+    buffer = io.BytesIO()
+    if name.endswith('.png'):
+        image.save(buffer, 'PNG', optimize=True)
+    elif name.endswith('.gif'):
+        image.save(buffer, 'GIF')
+    else:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def _store(name, data):
+    # Storage would pick a new name rather than overwrite
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, data)
+
+
+def generate(name, force=False):
+    """Writes every missing variant of the picture stored as name."""
+    wanted = variant_names(name)
+    if not force and all(default_storage.exists(variant) for variant in wanted):
+        return 0
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+
+    written = 0
+    for size in sizes():
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        _store(variant_name(name, size), _encode(thumbnail, variant_name(name, size)))
+        written += 1
+    optimized = image.copy()
+    longest = getattr(settings, 'RANGO_THUMBNAIL_OPTIMIZED_MAX', 1024)
+    optimized.thumbnail((longest, longest), Image.LANCZOS)
+    _store(variant_name(name, OPTIMIZED), _encode(optimized, variant_name(name, OPTIMIZED)))
+    return written + 1
+
+
+def _generate_logged(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Could not generate thumbnails for %s', name)
+
+
+def schedule(name):
+    """Generates the variants off the request path once the transaction commits."""
+    global _executor
+    if not getattr(settings, 'RANGO_THUMBNAILS_ASYNC', True):
+        transaction.on_commit(lambda: _generate_logged(name))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'RANGO_THUMBNAIL_WORKERS', 2))
+    transaction.on_commit(lambda: _executor.submit(_generate_logged, name))
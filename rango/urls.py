@@ -12,7 +12,11 @@ urlpatterns = [
     url(r'like/$', views_ajax.like_category, name='like_category'),
     url(r'^suggest/$', views_ajax.suggest_category, name='suggest_category'),
     url(r'^add/$', views_ajax.auto_add_page, name='auto_add_page'),
+    url(r'^add_pages/$', views_ajax.auto_add_pages, name='auto_add_pages'),
+    url(r'^category_pages/$', views_ajax.more_category_pages, name='more_category_pages'),
     url(r'^register_profile/$', views.register_profile, name='register_profile'),
     url(r'^profile/(?P<username>[\w\-]+)/$', views.profile, name='profile'),
     url(r'^profiles/$', views.list_profiles, name='list_profiles'),
+    url(r'^export/$', views.export_catalogue, name='export_catalogue'),
+    url(r'^metrics/$', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,19 +1,36 @@
+import hashlib
+import logging
+
 from django.contrib.auth import logout, authenticate, login
+from django.contrib.auth import views as auth_views
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.shortcuts import redirect
+from django.utils.decorators import method_decorator
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from rango.models import Category, Page, UserProfile
+from rango import (clicks, counters, db_router, exporter, hotness, leaderboards, local_search, metrics, storage,
+                   visits, write_queue)
+from rango.caching import cached_fragment, category_namespace
+from rango.conditional import category_etag, category_last_modified, conditional_page, index_etag
+from rango.pagination import InvalidCursor, decode_cursor, keyset_page
 from rango.forms import CategoryForm, PageForm, UserProfileForm, UserForm
-from datetime import datetime
-from rango.webhose_search import run_query
+from rango.search_cache import search_webhose
+from rango.throttle import client_ip, throttled
 from registration.backends.simple.views import RegistrationView
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-import json
-import urllib.parse  # Py3
-import urllib.request  # Py3
+from django.conf import settings
+from django.views.static import serve
+
+logger = logging.getLogger(__name__)
+
+# One year, the longest max-age caches honour
+IMMUTABLE_MAX_AGE = 31536000
 
 
 #
@@ -21,61 +38,30 @@ import urllib.request  # Py3
 #     context_dict = {'boldmessage': "Crunchy,creamy, cookie, candy, cupcake!"}
 #     return render(request, 'rango/index.html', context=context_dict)
 
-def get_server_side_cookie(request, cookie, default_val=None):
-    val = request.session.get(cookie)
-    if not val:
-        val = default_val
-    return val
-
-
-def visitor_cookie_handler(request):
-    # Get the number of visits to the site.
-    # We use the COOKIES.get() function to obtain the visits cookie.
-    # If the cookie exists, the value returned is casted to an integer.
-    # If the cookie doesn't exist, then the default value of 1 is used.
-    visits = int(get_server_side_cookie(request, 'visits', '1'))
-
-    last_visit_cookie = get_server_side_cookie(request, 'last_visit', str(datetime.now()))
-
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7], "%Y-%m-%d %H:%M:%S")
-    # last_visit_time = datetime.now()
-    # If it's been more than a day since the last visit...
-    if (datetime.now() - last_visit_time).seconds > 0:
-        visits = visits + 1
-        # update the last visit cookie now that we have updated the count
-        request.session['last_visit'] = str(datetime.now())
-    else:
-        visits = 1
-        # set the last visit cookie
-        request.session['last_visit'] = last_visit_cookie
-    # update/set the visits cookie
-    request.session['visits'] = visits
-
-
+@conditional_page('index', index_etag)
 def index(request):
     # context_dict = {'boldmessage': "Crunchie, creamy, cookie, candy, cupcake!"}
-    request.session.set_test_cookie()
-    category_list = Category.objects.order_by('-likes')[:5]
+    # Read from the incrementally maintained leaderboards, see rango/leaderboards.py
+    category_list = leaderboards.categories.objects()
 
-    page_list = Page.objects.order_by('-views')[:5]
-    context_dict = {'categories': category_list, 'pages': page_list}
+    page_list = leaderboards.pages.objects()
+    context_dict = {'categories': category_list, 'pages': page_list,
+                    'hot_categories': hotness.hot_categories(settings.RANGO_LEADERBOARD_SIZE)}
 
-    visitor_cookie_handler(request)
-    context_dict['visits'] = request.session['visits']
+    # Counted in a signed cookie, once per day, see rango/visits.py
+    visit = visits.current(request)
+    context_dict['visits'] = visit.count
 
-    print(request.session['visits'])
     response = render(request, 'rango/index.html', context=context_dict)
 
-    return response
+    return visits.remember(response, visit)
 
 
 def about(request):
-    if request.session.test_cookie_worked():
-        print("TEST COOKIE WORKED")
-        request.session.delete_test_cookie()
     return render(request, 'rango/about.html', {})
 
 
+@conditional_page('show_category', category_etag, category_last_modified)
 def show_category(request, category_name_slug):
     # Create a context dictionary which we can pass
     # to the template rendering engine.
@@ -86,12 +72,10 @@ def show_category(request, category_name_slug):
         # If we can't, the .get() method raises a DoesNotExist exception.
         # So the .get() method returns one model instance or raises an exception.
         category = Category.objects.get(slug=category_name_slug)
-        # Retrieve all of the associated pages.
-        # Note that filter() returns a list of page objects or an empty list
-        pages = Page.objects.filter(category=category)
-
-        # Adds our results list to the template context under name pages.
-        context_dict['pages'] = pages
+        # The heading and one page of the associated pages, most viewed
+        # first, cached until the category or one of its pages changes.
+        # The next pages are fetched on demand with the cursor in the list.
+        context_dict['body'] = category_body(category, request.GET.get('cursor'))
         # We also add the category object from
         # the database to the context dictionary.
         # We'll use this in the template to verify that the category exists.
@@ -102,12 +86,62 @@ def show_category(request, category_name_slug):
         # the template will display the "no category" message for us.
     except Category.DoesNotExist:
         context_dict['category'] = None
-        context_dict['pages'] = None
 
     # Go render the response and return it to the client.
     return render(request, 'rango/category.html', context_dict)
 
 
+PAGE_ORDERING = ['-views', '-id']
+
+
+def category_pages(category, cursor=None):
+    # Keyset pagination on (views, id), see rango/pagination.py.
+    # A stale or tampered cursor just starts over from the top.
+    pages = Page.objects.filter(category=category)
+    try:
+        return keyset_page(pages, PAGE_ORDERING, cursor, settings.RANGO_PAGES_PER_FRAGMENT)
+    except InvalidCursor:
+        return keyset_page(pages, PAGE_ORDERING, None, settings.RANGO_PAGES_PER_FRAGMENT)
+
+
+def _cursor_variant(cursor):
+    # Keyed by the position the cursor decodes to, not the string the client
+    # sent, so made-up cursors all share the first page's cache entry.
+    if not cursor:
+        return 'first'
+    try:
+        values = decode_cursor(cursor)
+    except InvalidCursor:
+        return 'first'
+    if not isinstance(values, list) or len(values) != len(PAGE_ORDERING):
+        return 'first'
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
+def category_page_list(category, cursor=None):
+    """
+    The rendered page_list.html fragment for one page of category's pages
+    ('' if it has none), cached under the category's version.
+    """
+    def render_list():
+        pages = category_pages(category, cursor)
+        if not pages.items:
+            return ''
+        return render_to_string('rango/page_list.html', {'pages': pages.items,
+                                                         'next_cursor': pages.next_cursor,
+                                                         'category': category})
+    return mark_safe(cached_fragment('page_list', category_namespace(category.pk), _cursor_variant(cursor),
+                                     render_list))
+
+
+def category_body(category, cursor=None):
+    def render_body():
+        return render_to_string('rango/category_body.html', {
+            'category': category, 'page_list': category_page_list(category, cursor)})
+    return mark_safe(cached_fragment('category_body', category_namespace(category.pk), _cursor_variant(cursor),
+                                     render_body))
+
+
 def add_category(request):
     form = CategoryForm()
 
@@ -132,13 +166,15 @@ def add_page(request, category_name_slug):
 
     form = PageForm()
     if request.method == 'POST':
-        form = PageForm(request.POST)
+        form = PageForm(request.POST, category=category)
         if form.is_valid():
             if category:
                 page = form.save(commit=False)
                 page.category = category
                 page.views = 0
-                page.save()
+                # By the single writer, see rango/write_queue.py
+                write_queue.run(page.save)
+                db_router.mark_write()
                 # probably better to use a redirect here.
             return show_category(request, category_name_slug)
         else:
@@ -149,6 +185,7 @@ def add_page(request, category_name_slug):
     return render(request, 'rango/add_page.html', context_dict)
 
 
+@throttled('register')
 def register(request):
     # Initial bool flag
     registered = False
@@ -192,6 +229,8 @@ def register(request):
                                                    'registered': registered})
 
 
+# Attempts per username and per IP are limited before any hashing, see rango/throttle.py
+@throttled('login')
 def user_login(request):
     # If post get info
     if request.method == 'POST':
@@ -208,12 +247,17 @@ def user_login(request):
                 return HttpResponse("Your Rango Account is disabled.")
         else:
             # Bad login Scenario
-            print('Invalid login details: {0}, {1}'.format(username, password))
+            logger.info('Invalid login for %r from %s', username, client_ip(request))
             return HttpResponse("Invalid Login Details Provided")
     else:
         return render(request, 'rango/login.html', {})
 
 
+# The login page of the registration app's URLs, throttled like user_login
+login_page = throttled('login')(auth_views.login)
+
+
+@method_decorator(throttled('register'), name='dispatch')
 class RangoRegistrationView(RegistrationView):
     def get_success_url(self, user):
         return reverse('register_profile')
@@ -225,12 +269,19 @@ def restricted(request):
 
 def search(request):
     result_list = []
+    local_result_list = []
     if request.method == 'POST':
         query = request.POST['query'].strip()
         if query:
-             # Run our Webhose function to get the results list!
-             result_list = run_query(query)
-    return render(request, 'rango/search.html', {'result_list': result_list})
+             # Our own categories and pages, straight from the local index
+             local_result_list = local_search.search(query)
+             # source=local skips the Webhose round trip altogether
+             if request.POST.get('source') != 'local':
+                 # Run our Webhose function to get the results list!
+                 # Repeated queries are answered from rango/search_cache.py
+                 result_list = search_webhose(query)
+    return render(request, 'rango/search.html', {'result_list': result_list,
+                                                 'local_result_list': local_result_list})
 
 @login_required
 def user_logout(request):
@@ -246,12 +297,17 @@ def track_url(request):
     if page_id:
         try:
             page = Page.objects.get(id=page_id)
-            page.views = page.views + 1
-            page.save()
-            return redirect(page.url)
-        except:
+        except (Page.DoesNotExist, ValueError):
             return HttpResponse("Page id {0} not found".format(page_id))
-    print("No page_id in get string")
+        # Buffered and written back in batches, see rango/counters.py
+        counters.incr(Page, page.pk, 'views')
+        leaderboards.pages.record_increment(page.pk, page.views + counters.pending(Page, page.pk, 'views'))
+        # Logged for the hourly/daily trending rollups, see rango/clicks.py
+        clicks.record(page.pk, page.category_id)
+        # Decayed category score, see rango/hotness.py
+        hotness.record(page.category_id, hotness.CLICK)
+        return redirect(page.url)
+    logger.debug('No page_id in get string')
     return redirect(reverse('index'))
 
 
@@ -278,8 +334,15 @@ def profile(request, username):
 @login_required
 def list_profiles(request):
 #    user_list = User.objects.all()
-    userprofile_list = UserProfile.objects.all()
-    return render(request, 'rango/list_profiles.html', { 'userprofile_list' : userprofile_list})
+    # One page of profiles at a time, keyset paginated on id
+    profiles = UserProfile.objects.select_related('user')
+    try:
+        userprofile_page = keyset_page(profiles, ['id'], request.GET.get('cursor'),
+                                       settings.RANGO_PROFILES_PER_PAGE)
+    except InvalidCursor:
+        userprofile_page = keyset_page(profiles, ['id'], None, settings.RANGO_PROFILES_PER_PAGE)
+    return render(request, 'rango/list_profiles.html', {'userprofile_list': userprofile_page.items,
+                                                        'next_cursor': userprofile_page.next_cursor})
 
 
 @login_required
@@ -301,62 +364,49 @@ def register_profile(request):
     return render(request, 'rango/profile_registration.html', context_dict)
 
 
-def read_webhose_key():
-    """
-#     Reads the Webhose API key from a file called 'search.key'.
-#     Returns either None (no key found), or a string representing the key.
-#     Remember: put search.key in your .gitignore file to avoid committing it!
-#     """
-    #     # See Python Anti-Patterns - it's an awesome resource!
-    #     # Here we are using "with" when opening files.
-    #     http://docs.quantifiedcode.com/python-anti-patterns/maintainability/
-    webhose_api_key = None
-    #
+@staff_member_required
+def export_catalogue(request):
+    # Streams every category with its pages, see rango/exporter.py
+    output_format = 'csv' if request.GET.get('format') == 'csv' else 'jsonl'
+    compress = request.GET.get('gzip') == '1'
     try:
-        with open('search.key', 'r') as f:
-            webhose_api_key = f.readline().strip()
-    except:
-        raise IOError('search.key file not found')
+        since_category_id = int(request.GET.get('since_category_id', 0))
+        since_page_id = int(request.GET.get('since_page_id', 0))
+    except ValueError:
+        return HttpResponse("since_category_id and since_page_id must be integers", status=400)
+
+    last_category_id, last_page_id = exporter.high_water_marks()
+    blocks = exporter.export_blocks(output_format, compress, since_category_id, since_page_id)
+    filename = 'rango-catalogue.{0}'.format(output_format)
+    if compress:
+        response = StreamingHttpResponse(blocks, content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(blocks, content_type='text/csv' if output_format == 'csv'
+                                         else 'application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(filename)
+    # Pass these back as since_category_id/since_page_id for the next incremental
+    # export, which has new rows only, not changes to these, see rango/exporter.py
+    response['X-Rango-Last-Category-Id'] = last_category_id
+    response['X-Rango-Last-Page-Id'] = last_page_id
+    return response
 
-    return webhose_api_key
 
+def serve_profile_image(request, path):
+    # Content-addressed names never change content, see rango/storage.py;
+    # production servers should send the same header for these paths. Their
+    # thumbnails can be regenerated in place, so they are revalidated.
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if storage.is_content_addressed(path):
+        response['Cache-Control'] = 'public, max-age={0}, immutable'.format(IMMUTABLE_MAX_AGE)
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
 
-def run_query(search_terms, size=10):
-    """
-#     Given a string containing search terms (query), and a number of results to return (default of 10),
-#     returns a list of results from the Webhose API, with each result consisting of a title, link and summary.
-#     """
-    webhose_api_key = read_webhose_key()
-    #
-    if not webhose_api_key:
-        raise KeyError('Webhose key not found')
-    #
-    # What's the base URL for the Webhose API?
-    root_url = 'http://webhose.io/search'
-    #
-    #     # Format the query string - escape special characters.
-    query_string = urllib.parse.quote(search_terms)  # Py3
-    #
-    #     # Use string formatting to construct the complete API URL.
-    search_url = '{root_url}?token={key}&format=json&q={query}&sort=relevancy&size={size}'.format(
-        root_url=root_url,
-        key=webhose_api_key,
-        query=query_string,
-        size=size)
-    results = []
 
-    try:
-        # Connect to the Webhose API, and convert the response to a Python dictionary.
-        response = urllib.request.urlopen(search_url).read().decode('utf-8')  # Py3 (library, decode)
-        json_response = json.loads(response)
-
-        # Loop through the posts, appendng each to the results list as a dictionary.
-        for post in json_response['posts']:
-            results.append({'title': post['title'],
-                            'link': post['url'],
-                            'summary': post['text'][:200]})
-    except:
-        print("Error when querying the Webhose API")
-
-    # Return the list of results to the calling function.
-    return results
+def metrics_view(request):
+    # Prometheus scrape target, see rango/metrics.py
+    allowed = getattr(settings, 'RANGO_METRICS_ALLOWED_IPS', ('127.0.0.1',))
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
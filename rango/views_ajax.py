@@ -1,9 +1,15 @@
-from django.shortcuts import render
+from django.shortcuts import get_object_or_404, render
 from django.shortcuts import redirect
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.db import transaction
+from django.views.decorators.http import require_POST
 from rango.models import Category, Page
+from rango import counters, db_router, hotness, leaderboards, local_search, prefix_index, write_queue
+from rango.caching import bump_version, category_namespace
+from rango.canonical_urls import url_hash
 from rango.forms import CategoryForm, PageForm
+from rango.views import category_page_list
 from datetime import datetime
 from rango.webhose_search import run_query
 
@@ -18,9 +24,13 @@ def like_category(request):
     if cat_id:
         cat = Category.objects.get(id=int(cat_id))
         if cat:
-            likes = cat.likes + 1
-            cat.likes = likes
-            cat.save()
+            # Buffered and written back in batches, see rango/counters.py
+            counters.incr(Category, cat.pk, 'likes')
+            likes = cat.likes + counters.pending(Category, cat.pk, 'likes')
+            leaderboards.categories.record_increment(cat.pk, likes)
+            hotness.record(cat.pk, hotness.LIKE)
+            # The buffered writes never reach the router; read the like back from the primary
+            db_router.mark_write()
     return HttpResponse(likes)
 
 
@@ -29,11 +39,8 @@ def like_category(request):
 def get_category_list(max_results=0, starts_with=''):
     cat_list = []
     if starts_with:
-        cat_list = Category.objects.filter(name__istartswith=starts_with)
-
-        if max_results > 0:
-            if len(cat_list) > max_results:
-                cat_list = cat_list[:max_results]
+        # Answered from the in-memory index, see rango/prefix_index.py
+        cat_list = prefix_index.categories.suggest(starts_with, max_results)
     return cat_list
 
 
@@ -53,16 +60,99 @@ def auto_add_page(request):
     cat_id = None
     url = None
     title = None
-    context_dict = {}
     if request.method == 'GET':
         cat_id = request.GET['category_id']
         url = request.GET['url']
         title = request.GET['title']
         if cat_id:
             category = Category.objects.get(id=int(cat_id))
-            p = Page.objects.get_or_create(category=category, title=title, url=url)
-            pages = Page.objects.filter(category=category).order_by('-views')
-            # Adds our results list to the template context under name pages.
-            context_dict['pages'] = pages
+            # Skipped if the category has the page under any URL variant
+            if not Page.objects.filter(category=category, url_hash=url_hash(url)).exists():
+                # By the single writer, see rango/write_queue.py
+                write_queue.run(lambda: Page.objects.create(category=category, title=title, url=url))
+                db_router.mark_write()
+            # Only the first page of the list is re-rendered (once, by
+            # whoever asks first after the save bumped the category's
+            # version); the rest is fetched on demand.
+            return HttpResponse(category_page_list(category))
+
+    return HttpResponse('')
+
+
+# Most (title, url) pairs auto_add_pages accepts in one request
+MAX_BATCH_PAGES = 100
+
+
+def add_pages(category, pairs):
+    """
+    Adds the (title, url) pairs whose canonical URL category does not have
+    yet, with one query to find the existing ones and one bulk insert;
+    returns how many were added. The pairs are not validated here, see
+    auto_add_pages.
+    """
+    wanted = {}
+    for title, url in pairs:
+        title, url = title.strip(), url.strip()
+        if title and url:
+            wanted.setdefault(url_hash(url), (title, url))
+    existing = set(Page.objects.filter(category=category, url_hash__in=list(wanted))
+                   .values_list('url_hash', flat=True))
+    new = [Page(category=category, title=title, url=url, url_hash=hashed)
+           for hashed, (title, url) in wanted.items() if hashed not in existing]
+    if not new:
+        return 0
+
+    def insert():
+        with transaction.atomic():
+            Page.objects.bulk_create(new)
+            # bulk_create() bypasses the model signals, and does not return
+            # primary keys on SQLite
+            created = list(Page.objects.filter(category=category, url_hash__in=[page.url_hash for page in new])
+                           .values_list('pk', 'title', 'url'))
+            local_search.index_pages(created)
+        return created
+
+    # By the single writer, see rango/write_queue.py
+    created = write_queue.run(insert)
+    db_router.mark_write()
+    bump_version(category_namespace(category.pk))
+    bump_version('page')
+    for pk, title, url in created:
+        leaderboards.pages.offer(pk, 0)
+    return len(new)
+
+
+@login_required
+@require_POST
+def auto_add_pages(request):
+    # Batch version of auto_add_page, for adding several search results at once
+    category = _category_or_404(request.POST.get('category_id'))
+    titles = request.POST.getlist('title')
+    urls = request.POST.getlist('url')
+    if len(titles) != len(urls) or len(titles) > MAX_BATCH_PAGES:
+        return HttpResponseBadRequest('Expected at most {0} title/url pairs'.format(MAX_BATCH_PAGES))
+    # The same checks as the add_page form, so no javascript: URLs or
+    # over-long titles; one bad pair rejects the whole batch
+    pairs = []
+    for title, url in zip(titles, urls):
+        form = PageForm({'title': title.strip(), 'url': url.strip(), 'views': 0})
+        if not form.is_valid():
+            return HttpResponseBadRequest('Invalid title/url pair: {0}'.format(form.errors.as_text()))
+        pairs.append((form.cleaned_data['title'], form.cleaned_data['url']))
+    add_pages(category, pairs)
+    return HttpResponse(category_page_list(category))
+
+
+def _category_or_404(category_id):
+    # get_object_or_404 raises ValueError (a 500) for ids that are not numbers
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        raise Http404('No such category')
+    return get_object_or_404(Category, id=category_id)
+
 
-    return render(request, 'rango/page_list.html', context_dict)
\ No newline at end of file
+def more_category_pages(request):
+    # The next page of a category's page list, for the "More pages" link
+    category = _category_or_404(request.GET.get('category_id'))
+    return HttpResponse(category_page_list(category, request.GET.get('cursor')))
@@ -0,0 +1,46 @@
+"""
+Visit counting without session writes.
+
+The count lives in a signed cookie, "<visits>:<YYYY-MM-DD of the last
+counted visit>", so reading it costs nothing and it cannot be tampered with.
+A visit is counted at most once per calendar day in TIME_ZONE: the first
+visit on a new day increments it and is the only time the cookie is set
+again. Every other request leaves both the cookie and the session alone.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from django.core import signing
+from django.utils import timezone
+
+COOKIE = 'rango_visits'
+SALT = 'rango.visits'
+MAX_AGE = 365 * 24 * 60 * 60
+
+Visit = namedtuple('Visit', ['count', 'day', 'changed'])
+
+
+def _read(request):
+    try:
+        value = request.get_signed_cookie(COOKIE, salt=SALT, max_age=MAX_AGE)
+        count, day = value.split(':')
+        return int(count), datetime.strptime(day, '%Y-%m-%d').date()
+    except (KeyError, signing.BadSignature, ValueError):
+        return 0, None
+
+
+def current(request):
+    """Returns this request's Visit, counting it if it is the first today."""
+    count, day = _read(request)
+    today = timezone.localdate()
+    if day is not None and day >= today:
+        return Visit(count, day, False)
+    return Visit(count + 1, today, True)
+
+
+def remember(response, visit):
+    """Sets the cookie on response, only if the count changed."""
+    if visit.changed:
+        response.set_signed_cookie(COOKIE, '{0}:{1}'.format(visit.count, visit.day.isoformat()),
+                                   salt=SALT, max_age=MAX_AGE, httponly=True)
+    return response
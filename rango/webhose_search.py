@@ -1,7 +1,20 @@
+import http.client
 import json
-import urllib
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.parse  # Py3
+from concurrent.futures import ThreadPoolExecutor
 
-def read_webhose_key():
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def read_webhose_key(path='search.key'):
     """
     Reads the Webhose API key from a file called 'search.key'.
     Returns either None (no key found), or a string representing the key.
@@ -11,125 +24,208 @@ def read_webhose_key():
     # Here we are using "with" when opening files.
     # http://docs.quantifiedcode.com/python-anti-patterns/maintainability/
     webhose_api_key = None
-    
+
     try:
-        with open('search.key', 'r') as f:
+        with open(path, 'r') as f:
             webhose_api_key = f.readline().strip()
     except:
         raise IOError('search.key file not found')
-    
+
     return webhose_api_key
 
+
+class WebhoseError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Keeps idle keep-alive connections to one host so that consecutive
+    searches skip the TCP (and TLS) handshake.
+    """
+
+    def __init__(self, scheme, host, port=None, max_idle=8, connect_timeout=3.0, read_timeout=10.0):
+        self.connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = self.connection_class(self.host, self.port, timeout=self.connect_timeout)
+            conn.connect()
+            # The connect timeout only covers the handshake; every read
+            # after that gets the (longer) read timeout.
+            conn.sock.settimeout(self.read_timeout)
+            return conn
+
+    def put(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class WebhoseClient(object):
+    """
+    Reusable Webhose API client.
+
+    The API key is read once and re-read only when search.key changes on
+    disk. Requests go over pooled keep-alive connections with connect and
+    read timeouts, failed requests are retried with exponential backoff, and
+    a search for more results than fit in one API page fetches the pages
+    concurrently and merges them back in order. A search gives up once it
+    has taken budget seconds, whatever retries it has left, and no read
+    waits past that point.
+    """
+    root_url = 'http://webhose.io/search'
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, key_path='search.key', root_url=None, page_size=100, max_workers=4,
+                 connect_timeout=3.0, read_timeout=10.0, retries=2, backoff=0.5, budget=15.0):
+        self.key_path = key_path
+        if root_url:
+            self.root_url = root_url
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff = backoff
+        self.budget = budget
+        url = urllib.parse.urlsplit(self.root_url)
+        self.path = url.path or '/'
+        self.pool = ConnectionPool(url.scheme, url.hostname, url.port, max_idle=max_workers,
+                                   connect_timeout=connect_timeout, read_timeout=read_timeout)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._key = None
+        self._key_mtime = None
+        self._key_lock = threading.Lock()
+
+    def api_key(self):
+        try:
+            mtime = os.stat(self.key_path).st_mtime
+        except OSError:
+            raise IOError('search.key file not found')
+        with self._key_lock:
+            if self._key is None or mtime != self._key_mtime:
+                self._key = read_webhose_key(self.key_path)
+                self._key_mtime = mtime
+            return self._key
+
+    def search(self, search_terms, size=10):
+        """
+        Returns up to size results for search_terms, each a dictionary with
+        a title, link and summary.
+        """
+        key = self.api_key()
+        if not key:
+            raise KeyError('Webhose key not found')
+
+        deadline = time.monotonic() + self.budget
+        offsets = range(0, size, self.page_size)
+        if len(offsets) == 1:
+            pages = [self._fetch_page(key, search_terms, 0, size, deadline)]
+        else:
+            # map() yields in submission order, so the merged list keeps
+            # the API's ranking.
+            pages = self.executor.map(
+                lambda offset: self._fetch_page(key, search_terms, offset, min(self.page_size, size - offset),
+                                                deadline),
+                offsets)
+        results = []
+        for posts in pages:
+            for post in posts:
+                results.append({'title': post['title'],
+                                'link': post['url'],
+                                'summary': post['text'][:200]})
+        return results[:size]
+
+    def _fetch_page(self, key, search_terms, offset, size, deadline):
+        query_string = urllib.parse.urlencode([
+            ('token', key), ('format', 'json'), ('q', search_terms),
+            ('sort', 'relevancy'), ('size', size), ('from', offset)])
+        return self._get('{0}?{1}'.format(self.path, query_string), deadline).get('posts', [])
+
+    def _get(self, path, deadline):
+        attempt = 0
+        while True:
+            try:
+                return self._request(path, deadline)
+            except (WebhoseError, http.client.HTTPException, socket.timeout, OSError):
+                delay = self.backoff * (2 ** attempt)
+                if attempt >= self.retries or time.monotonic() + delay >= deadline:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def _request(self, path, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout('Webhose search ran out of time')
+        conn = self.pool.get()
+        if conn.sock is not None:
+            conn.sock.settimeout(min(self.pool.read_timeout, remaining))
+        try:
+            conn.request('GET', path, headers={'Accept': 'application/json'})
+            response = conn.getresponse()
+            body = response.read()
+        except Exception:
+            # Half-used connections are never returned to the pool.
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self.pool.put(conn)
+        if response.status in self.retry_statuses:
+            raise WebhoseError('Webhose API returned {0}'.format(response.status))
+        if response.status != 200:
+            raise ValueError('Webhose API returned {0}'.format(response.status))
+        return json.loads(body.decode('utf-8'))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WebhoseClient(
+                    connect_timeout=getattr(settings, 'RANGO_WEBHOSE_CONNECT_TIMEOUT', 3.0),
+                    read_timeout=getattr(settings, 'RANGO_WEBHOSE_READ_TIMEOUT', 10.0),
+                    retries=getattr(settings, 'RANGO_WEBHOSE_RETRIES', 2),
+                    budget=getattr(settings, 'RANGO_WEBHOSE_BUDGET', 15.0),
+                    max_workers=getattr(settings, 'RANGO_WEBHOSE_MAX_WORKERS', 4))
+    return _client
+
+
 def run_query(search_terms, size=10):
     """
     Given a string containing search terms (query), and a number of results to return (default of 10),
     returns a list of results from the Webhose API, with each result consisting of a title, link and summary.
     """
-    webhose_api_key = read_webhose_key()
-    
-    if not webhose_api_key:
+    client = get_client()
+    if not client.api_key():
         raise KeyError('Webhose key not found')
-    
-    
-    # What's the base URL for the Webhose API?
-    root_url = 'http://webhose.io/search'
-    
-    # Format the query string - escape special characters.
-    query_string = urllib.quote(search_terms)
-    
-    # Use string formatting to construct the complete API URL.
-    search_url = '{root_url}?token={key}&format=json&q={query}&sort=relevancy&size={size}'.format(
-                    root_url=root_url,
-                    key=webhose_api_key,
-                    query=query_string,
-                    size=size)
-    
+
     results = []
-    
+
     try:
-        # Connect to the Webhose API, and convert the response to a Python dictionary.
-        print(search_url)
-        response = urllib3.urlopen(search_url).read()
-        print(response)
-        json_response = json.loads(response)
-        
-        # Loop through the posts, appendng each to the results list as a dictionary.
-        for post in json_response['posts']:
-            print(post['title'])
-            results.append({'title': post['title'],
-                            'link': post['url'],
-                            'summary': post['text'][:200]})
-    except Exception as e: 
-        print(e)
-        print("Error when querying the Webhose API")
-    
+        results = client.search(search_terms, size)
+    except Exception:
+        logger.exception('Error when querying the Webhose API')
+
     # Return the list of results to the calling function.
     return results
-
-####
-#### The code below is the Python 3 version.
-####
-
-# import json
-# import urllib.parse  # Py3
-# import urllib.request  # Py3
-#
-# def read_webhose_key():
-#     """
-#     Reads the Webhose API key from a file called 'search.key'.
-#     Returns either None (no key found), or a string representing the key.
-#     Remember: put search.key in your .gitignore file to avoid committing it!
-#     """
-#     # See Python Anti-Patterns - it's an awesome resource!
-#     # Here we are using "with" when opening files.
-#     # http://docs.quantifiedcode.com/python-anti-patterns/maintainability/
-#     webhose_api_key = None
-#
-#     try:
-#         with open('search.key', 'r') as f:
-#             webhose_api_key = f.readline().strip()
-#     except:
-#         raise IOError('search.key file not found')
-#
-#     return webhose_api_key
-#
-# def run_query(search_terms, size=10):
-#     """
-#     Given a string containing search terms (query), and a number of results to return (default of 10),
-#     returns a list of results from the Webhose API, with each result consisting of a title, link and summary.
-#     """
-#     webhose_api_key = read_webhose_key()
-#
-#     if not webhose_api_key:
-#         raise KeyError('Webhose key not found')
-#
-#     # What's the base URL for the Webhose API?
-#     root_url = 'http://webhose.io/search'
-#
-#     # Format the query string - escape special characters.
-#     query_string = urllib.parse.quote(search_terms)  # Py3
-#
-#     # Use string formatting to construct the complete API URL.
-#     search_url = '{root_url}?token={key}&format=json&q={query}&sort=relevancy&size={size}'.format(
-#                     root_url=root_url,
-#                     key=webhose_api_key,
-#                     query=query_string,
-#                     size=size)
-#
-#     results = []
-#
-#     try:
-#         # Connect to the Webhose API, and convert the response to a Python dictionary.
-#         response = urllib.request.urlopen(search_url).read().decode('utf-8')  #Py3 (library, decode)
-#         json_response = json.loads(response)
-#
-#         # Loop through the posts, appendng each to the results list as a dictionary.
-#         for post in json_response['posts']:
-#             results.append({'title': post['title'],
-#                             'link': post['url'],
-#                             'summary': post['text'][:200]})
-#     except:
-#         print("Error when querying the Webhose API")
-#
-#     # Return the list of results to the calling function.
-#     return results
\ No newline at end of file
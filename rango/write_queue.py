@@ -0,0 +1,140 @@
+"""
+Single-writer queue for the buffered writes to SQLite.
+
+SQLite lets one connection write at a time. When the counter, click and
+hot score buffers of several threads flush at once, each on its own
+connection, they queue on the write lock and, past busy_timeout, fail with
+"database is locked". Instead they hand their writes to this queue: one
+thread per process runs them on one connection, and runs whatever is
+waiting together in a single transaction, each job in its own savepoint so
+that one failing job does not undo the others. The callers block until
+their batch has committed and get the job's return value (or exception)
+back.
+
+A caller already inside an atomic block runs its job inline: it may hold
+the write lock already, and its writes must commit or roll back with its
+own transaction.
+"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue(object):
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, max_batch=100):
+        self.using = using
+        self.max_batch = max_batch
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._jobs = None
+
+    def submit(self, func):
+        """Queues func() to run in the writer's next transaction; returns a Future."""
+        if connections[self.using].in_atomic_block:
+            future = Future()
+            try:
+                future.set_result(func())
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        future = Future()
+        self._get_jobs().put((func, future))
+        return future
+
+    def run(self, func):
+        """Runs func() in the writer's next transaction and returns its result."""
+        return self.submit(func).result()
+
+    def _get_jobs(self):
+        # A forked worker does not inherit the parent's writer thread
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._jobs = queue.Queue()
+                thread = threading.Thread(target=self._write_forever, args=(self._jobs,),
+                                          name='rango-writer')
+                thread.daemon = True
+                thread.start()
+            return self._jobs
+
+    def close(self):
+        """Runs the jobs queued so far, then stops the writer thread and closes its connection."""
+        with self._lock:
+            jobs, self._jobs, self._pid = self._jobs, None, None
+        if jobs is not None:
+            stopped = Future()
+            jobs.put((None, stopped))
+            stopped.result()
+
+    def _write_forever(self, jobs):
+        connections[self.using].begin_immediate = True
+        stopped = None
+        while stopped is None:
+            batch = []
+            job = jobs.get()
+            while True:
+                if job[0] is None:
+                    stopped = job[1]
+                    break
+                batch.append(job)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    job = jobs.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+        connections[self.using].close()
+        stopped.set_result(None)
+
+    def _write(self, batch):
+        connection = connections[self.using]
+        results = []
+        try:
+            with transaction.atomic(using=self.using):
+                for func, future in batch:
+                    try:
+                        with transaction.atomic(using=self.using):
+                            results.append((future, func(), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            logger.exception('Write batch of %d jobs failed', len(batch))
+            for func, future in batch:
+                future.set_exception(e)
+            connection.close()
+            return
+        finally:
+            self.batches += 1
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteQueue(max_batch=getattr(settings, 'RANGO_WRITE_QUEUE_MAX_BATCH', 100))
+    return _queue
+
+
+def run(func):
+    return get_queue().run(func)
@@ -0,0 +1,10 @@
+$(document).ready(function() {
+    // Fetch the next page of a category's page list in place
+    $('#pages').on('click', '.more-pages a', function(event) {
+        event.preventDefault();
+        var more = $(this).closest('li');
+        $.get($(this).data('url'), function(data) {
+            more.replaceWith(data);
+        });
+    });
+});
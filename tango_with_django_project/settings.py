@@ -44,6 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    # First, so that its timings cover the other middleware too
+    'rango.metrics.RequestMetricsMiddleware',
+    # Before SessionMiddleware, so that session saves pin the client too
+    'rango.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,13 +56,16 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # A full password hashing pool is a 503, not a 500, see rango/throttle.py
+    'rango.throttle.PasswordHashingBusyMiddleware',
 ]
 
 ROOT_URLCONF = 'tango_with_django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing, see rango/metrics.py
+        'BACKEND': 'rango.backends.templates.TimedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,17 +87,63 @@ WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 with query timing, see rango/metrics.py
+        'ENGINE': 'rango.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Set on every new connection, see rango/backends/sqlite3
+        'PRAGMAS': {
+            'journal_mode': 'wal',  # readers and the writer don't block each other
+            'synchronous': 'normal',  # fsync at checkpoints only; safe with WAL
+            'busy_timeout': 5000,  # ms to wait for the write lock before "database is locked"
+            'cache_size': -20000,  # page cache per connection, in KiB when negative
+            'mmap_size': 256 * 1024 * 1024,  # bytes
+        },
+    }
+}
+
+# Shared by every worker process on this host, so that cache version bumps,
+# leaderboards, throttle buckets and counter flush requests reach all of
+# them; a per-process cache would keep serving stale fragments. Several
+# hosts need a networked cache (memcached) here instead. The file cache is
+# Django's with cheaper culling, see rango/backends/filecache.py. The tests
+# run against a private in-memory cache, see rango/test_runner.py, apart
+# from those of SharedCacheTests.
+CACHES = {
+    'default': {
+        'BACKEND': 'rango.backends.filecache.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_INTERVAL': 10},
     }
 }
+TEST_RUNNER = 'rango.test_runner.RangoTestRunner'
+
+# Buffered counter, click and hot score writes are run by one writer thread
+# per process, this many jobs per transaction at most, see rango/write_queue.py
+RANGO_WRITE_QUEUE_MAX_BATCH = 100
+
+# Reads go to these aliases (each also in DATABASES, e.g. with
+# 'TEST': {'MIRROR': 'default'}), writes to 'default'. A client that wrote
+# reads from 'default' for RANGO_DB_STICKY_SECONDS. See rango/db_router.py
+DATABASE_ROUTERS = ['rango.db_router.PrimaryReplicaRouter']
+RANGO_DB_REPLICAS = []
+RANGO_DB_STICKY_SECONDS = 5
 
 # Password hashing functions
 # https://docs.djangoproject.com/en/1.9/topics/auth/passwords/#how-django-stores-passwords
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    # PBKDF2 on a bounded thread pool, see rango/hashers.py
+    'rango.hashers.PooledPBKDF2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
 ]
+RANGO_PASSWORD_HASH_WORKERS = 2  # threads hashing at once, per process
+RANGO_PASSWORD_HASH_QUEUE = 8  # hashes waiting for a thread before the rest get a 503
+
+# Login and registration attempts, checked before hashing, see rango/throttle.py.
+# (burst, seconds to earn back one attempt) per bucket
+RANGO_PASSWORD_THROTTLE = {
+    'username': (5, 60),
+    'ip': (20, 6),
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -139,3 +192,79 @@ LOGIN_URL = '/accounts/login/'
 
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL = '/media/'
+
+# Page.views and Category.likes increments are buffered in memory and
+# written back in batches, see rango/counters.py
+RANGO_COUNTER_FLUSH_INTERVAL = 5  # seconds
+RANGO_COUNTER_FLUSH_THRESHOLD = 100  # pending increments
+
+# Number of categories/pages on the index page leaderboards, see rango/leaderboards.py
+RANGO_LEADERBOARD_SIZE = 5
+RANGO_LEADERBOARD_TTL = 60  # seconds before a board is rebuilt from the database
+
+# Webhose search result cache, see rango/search_cache.py
+RANGO_SEARCH_CACHE_TTL = 300  # seconds a result is fresh
+RANGO_SEARCH_CACHE_STALE_TTL = 3600  # seconds an expired result may still be served while it refreshes
+RANGO_SEARCH_CACHE_MAX_ENTRIES = 500
+
+# Webhose API client, see rango/webhose_search.py
+RANGO_WEBHOSE_CONNECT_TIMEOUT = 3  # seconds
+RANGO_WEBHOSE_READ_TIMEOUT = 10  # seconds
+RANGO_WEBHOSE_RETRIES = 2
+RANGO_WEBHOSE_BUDGET = 15  # seconds a search may take, retries included
+RANGO_WEBHOSE_MAX_WORKERS = 4  # pooled connections / concurrent page fetches
+
+# Keyset pagination page sizes, see rango/pagination.py
+RANGO_PAGES_PER_FRAGMENT = 20
+RANGO_PROFILES_PER_PAGE = 20
+
+# Profile picture variants, generated in the background after upload,
+# see rango/thumbnails.py
+RANGO_THUMBNAIL_SIZES = (64, 128, 256)
+RANGO_THUMBNAIL_OPTIMIZED_MAX = 1024  # longest side of the optimised copy, in pixels
+RANGO_THUMBNAILS_ASYNC = True
+RANGO_THUMBNAIL_WORKERS = 2
+# Seconds a just deduplicated profile picture is kept from deletion, see rango/storage.py
+RANGO_PROFILE_IMAGE_RELEASE_GRACE = 60
+
+# Session storage profile. 'cached_db' serves sessions from the cache and
+# only reads the database on a miss; 'cache' never touches the database but
+# loses sessions when the cache is cleared, and needs a cache shared by all
+# processes (not the default per-process LocMemCache) to be useful. Visit
+# counting does not use the session at all, see rango/visits.py.
+RANGO_SESSION_PROFILE = 'cached_db'
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+}[RANGO_SESSION_PROFILE]
+
+# Addresses that may read /rango/metrics/ without logging in as staff,
+# see rango/metrics.py
+RANGO_METRICS_ALLOWED_IPS = ('127.0.0.1',)
+
+# Cache-Control per conditional view and auth state, see rango/conditional.py.
+# The index page carries the per-visitor visits cookie, so it stays private.
+RANGO_CACHE_CONTROL = {
+    'index': {'anonymous': 'private, max-age=0, must-revalidate',
+              'authenticated': 'private, max-age=0, must-revalidate'},
+    'show_category': {'anonymous': 'public, max-age=60',
+                      'authenticated': 'private, max-age=0, must-revalidate'},
+}
+
+# check_links command, see rango/link_checker.py
+RANGO_LINK_CHECK_CONCURRENCY = 100  # requests in flight
+RANGO_LINK_CHECK_PER_HOST = 2  # requests in flight to any one host
+RANGO_LINK_CHECK_TIMEOUT = 10  # seconds per request
+
+# Click log behind the trending pages, see rango/clicks.py
+RANGO_CLICK_FLUSH_INTERVAL = 5  # seconds
+RANGO_CLICK_FLUSH_THRESHOLD = 500  # buffered clicks
+RANGO_CLICK_HOURLY_RETENTION_DAYS = 8
+
+# Hot categories, see rango/hotness.py
+# A like or click counts half as much after this. Stored scores depend on
+# it: after changing it, reset them with Category.objects.update(hot=None)
+# or old and new scores are ranked against each other wrongly.
+RANGO_HOT_HALF_LIFE_HOURS = 72
+RANGO_HOT_WEIGHTS = {'like': 1.0, 'click': 0.2}
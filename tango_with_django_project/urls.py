@@ -25,5 +25,15 @@ urlpatterns = [
     url(r'^rango/', include('rango.urls')),
     url(r'^admin/', admin.site.urls),
     url(r'^accounts/register/$', views.RangoRegistrationView.as_view(), name='registration_register'),
+    url(r'^accounts/login/$', views.login_page, {'template_name': 'registration/login.html'}, name='auth_login'),
     url(r'^accounts/', include('registration.backends.simple.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
+
+if settings.DEBUG:
+    # Content-addressed profile pictures and their thumbnails get long-lived cache headers
+    urlpatterns += [
+        url(r'^{0}(?P<path>profile_images/[0-9a-f]{{2}}/.*)$'.format(settings.MEDIA_URL.lstrip('/')),
+            views.serve_profile_image),
+    ]
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)